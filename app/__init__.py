@@ -20,7 +20,23 @@ def create_app():
     from .routes import register_routes
     register_routes(app)
 
+    from .migrations import apply_migrations, register_cli
+    from .rollup import register_cli as register_rollup_cli
+    register_cli(app)
+    register_rollup_cli(app)
+
     with app.app_context():
         db.create_all()
+        # Индексы и прочие изменения схемы для уже существующих баз
+        apply_migrations(db.engine)
+
+    # Версия журнала растёт при любом изменении сделок (ETag API, кеши статистики)
+    from .journal import track_journal_changes
+    track_journal_changes()
+
+    # Опциональный фоновый прогрев AI (модель и индексы) сразу после старта
+    if os.getenv('AI_WARMUP', '0') == '1':
+        from .routes.ai import start_ai_warmup
+        start_ai_warmup(app)
 
     return app
\ No newline at end of file
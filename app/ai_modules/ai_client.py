@@ -1,30 +1,67 @@
 import os
+import json
+import atexit
+import hashlib
+import importlib.util
 import requests
 import numpy as np
 import faiss
 import re
-from datetime import datetime
+import threading
+from datetime import datetime, date, timedelta
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from sentence_transformers import SentenceTransformer
+from typing import Iterable, Iterator, List, Optional, Tuple
 from app.models import Trade
+from app.journal import journal_version
 
 
 # Импортируем провайдер новостей
-from ..ai_modules.news_provider import ForexNewsProvider
+from ..ai_modules.news_provider import get_news_provider, news_key
+from ..ai_modules.calendar_store import CALENDAR_WINDOW_HOURS, get_calendar_store, trade_anchor
+from ..ai_modules.embedding_store import EmbeddingStore, fingerprint, save_index_snapshot, load_index_snapshot
+from ..ai_modules.index_backends import resolve_index_type, create_index, build_index, index_kind, \
+    supports_remove, search_params, is_exhaustive
+from ..ai_modules.lru_cache import TTLCache
+from ..ai_modules.context_packer import estimate_tokens, pack_rows, resolve_budget, table_cell
+from ..ai_modules.trade_store import TradeColumns
+from ..ai_modules.response_cache import ResponseCache
 
 
 class AI_Client:
     """
-    ПРОСТАЯ AI-система - ключ передается при каждом запросе
+    Общий AI-движок (модель эмбеддингов и индексы).
+    API ключ не хранится в движке - он передается при каждом запросе
     """
 
-    def __init__(self, db_session: Session, api_key: str = None):
+    # Ключевые слова для структурных фильтров по колонкам Trade
+    # Основы слов ищутся только с начала слова (\b в str-шаблонах учитывает кириллицу),
+    # иначе "ази" находится в "магазин" и "фантазия"
+    FILTER_KEYWORDS = {
+        "session": {
+            "LONDON": [r"\bлондон", r"\blondon"],
+            "NY": [r"\bнью[- ]?йорк", r"\bnew york", r"\bny\b", r"\bамерик"],
+            "ASIA": [r"\bази(?:я|и|ю|ей|атск)", r"\basia", r"\bтокио"],
+        },
+        "position": {
+            "Long": [r"\bлонг", r"\blong", r"\bпокупк"],
+            "Short": [r"\bшорт", r"\bshort", r"\bпродаж"],
+        },
+        "result_type": {
+            "TP": [r"\btp\b", r"\bтейк", r"\bприбыльн", r"\bвыигрыш"],
+            "SL": [r"\bsl\b", r"\bстоп", r"\bубыточн", r"\bпроигрыш"],
+            "BE": [r"\bbe\b", r"\bбезубыт"],
+        },
+    }
+
+    # "с 01.07.2025 по 10.07.2025"
+    RANGE_PATTERN = r'\bс\s+([\d.\-]+)\s+по\s+([\d.\-]+)'
+    # "за последние 2 недели", "за месяц", "за 10 дней"
+    PERIOD_PATTERN = r'за\s+(?:последн\w*\s+)?(\d+)?\s*(дн\w*|день|недел\w*|месяц\w*|год\w*)'
+    PERIOD_DAYS = {'дн': 1, 'де': 1, 'не': 7, 'ме': 30, 'го': 365}
+
+    def __init__(self, db_session: Session):
         self.db = db_session
 
-        # Просто сохраняем переданный ключ
-        self.api_key = api_key
-
         # Инициализация AI компонентов
         self._initialize_ai_components()
 
@@ -32,103 +69,365 @@ class AI_Client:
         self._load_and_index_trades()
         self._load_news_data()
 
-    def set_api_key(self, api_key: str):
+    @property
+    def embedding_model(self):
         """
-        Простая установка API ключа из localStorage
+        Модель загружается только когда действительно нужно что-то закодировать.
+        Загрузку могут одновременно запросить прогрев и воркеры очереди - модель грузится один раз
         """
-        if api_key and api_key.strip():
-            self.api_key = api_key.strip()
-            print(f"✅ API ключ установлен")
-            return True
-        return False
+        if self._embedding_model is not None:
+            return self._embedding_model
+
+        with self._embedding_model_lock:
+            if self._embedding_model is not None:
+                return self._embedding_model
+
+            print(f"🔄 Загрузка модели эмбеддингов {self.embedding_model_name} ({self.embedding_backend})...")
+            if self.embedding_backend == "torch":
+                # torch и sentence_transformers импортируются только при первой необходимости
+                from sentence_transformers import SentenceTransformer
+
+                self._embedding_model = SentenceTransformer(self.embedding_model_name)
+            else:
+                from ..ai_modules.onnx_encoder import OnnxSentenceEncoder
+
+                self._embedding_model = OnnxSentenceEncoder(
+                    self.embedding_model_name, quantize=self.embedding_backend == "onnx-int8"
+                )
+            return self._embedding_model
+
+    @staticmethod
+    def _resolve_embedding_backend() -> str:
+        """
+        Бэкенд эмбеддингов из AI_EMBEDDING_BACKEND: torch (SentenceTransformer),
+        onnx или onnx-int8 (ONNX Runtime без torch в рабочем процессе)
+        """
+        backend = os.getenv("AI_EMBEDDING_BACKEND", "torch").strip().lower()
+        if backend not in ("torch", "onnx", "onnx-int8"):
+            print(f"⚠️ Неизвестный бэкенд эмбеддингов {backend}, используется torch")
+            return "torch"
+        if backend != "torch" and not all(importlib.util.find_spec(name) for name in ("onnxruntime", "tokenizers")):
+            print("⚠️ Для ONNX бэкенда нужны onnxruntime и tokenizers, используется torch")
+            return "torch"
+        return backend
+
+    def _encode_batch(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """Пакетное кодирование текстов"""
+        return self.embedding_model.encode(
+            texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False
+        ).astype("float32")
+
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Эмбеддинги через дисковый кеш: кодируются только отсутствующие тексты"""
+        return self.embedding_store.encode(texts, self._encode_batch)
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        """Эмбеддинг запроса с кешем по нормализованному тексту"""
+        key = " ".join(query.lower().split())
+        query_embedding = self.query_embeddings.get(key)
+        if query_embedding is None:
+            query_embedding = self.embedding_model.encode(query, convert_to_numpy=True)
+            query_embedding = query_embedding.astype("float32").reshape(1, -1)
+            self.query_embeddings.put(key, query_embedding)
+        return query_embedding
+
+    def stats(self) -> dict:
+        """Состояние AI системы для мониторинга"""
+        return {
+            "embedding_backend": self.embedding_backend,
+            "index_type": self.index_type,
+            "trade_index_kind": index_kind(self.trade_index) if self.trade_index is not None else None,
+            "trades_indexed": len(self.trade_store),
+            "news_indexed": len(self.news_texts),
+            "calendar": get_calendar_store().stats(),
+            "query_embedding_cache": self.query_embeddings.stats(),
+            "response_cache": self.response_cache.stats(),
+        }
 
     def _initialize_ai_components(self):
         """Инициализация AI моделей и настроек"""
         print("🔄 Инициализация AI системы...")
-        self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+        self.embedding_model_name = "all-MiniLM-L6-v2"
+        self._embedding_model = None
+        self._embedding_model_lock = threading.Lock()
+        self.embedding_backend = self._resolve_embedding_backend()
         self.dim = 384
 
-        # FAISS индексы
+        # Дисковый кеш эмбеддингов и снимков индекса.
+        # Векторы разных бэкендов немного отличаются, поэтому кешируются раздельно
+        store_name = self.embedding_model_name
+        if self.embedding_backend != "torch":
+            store_name = f"{self.embedding_model_name}@{self.embedding_backend}"
+        self.embedding_store = EmbeddingStore(store_name)
+        self.index_dir = os.path.join("cache", "indexes")
+        self.trade_snapshot_path = os.path.join(self.index_dir, "trades.faiss")
+        # После изменений журнала снимок индекса сделок пересохраняется через AI_SNAPSHOT_DELAY секунд
+        # после последнего изменения и при выходе из процесса
+        self.snapshot_delay = float(os.getenv("AI_SNAPSHOT_DELAY", "30"))
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_timer = None
+        self._trade_index_version = None
+        atexit.register(self.save_trade_snapshot)
+
+        # Кеш эмбеддингов запросов - общий для поиска сделок и новостей
+        self.query_embeddings = TTLCache(maxsize=512, ttl=3600)
+
+        # Кеш ответов LLM по хешу промпта; сбрасывается при изменении сделок и новостей
+        self.response_cache = ResponseCache(maxsize=256, ttl=900)
+
+        # FAISS индексы (индекс сделок адресуется по Trade.id); тип задаётся AI_INDEX_TYPE
+        self.index_type = resolve_index_type()
         self.trade_index = None
         self.news_index = None
-        self.trade_texts = []
-        self.news_texts = []
-        self.all_trades = []
+        self.trade_store = TradeColumns()
+        # Новости адресуются стабильным id события (см. _news_id)
+        self.news_texts = {}
+        self.news_items = {}
+        self._news_update_lock = threading.Lock()
+        self._trade_index_mmapped = False
+        self._index_lock = threading.RLock()
+        # Новости вокруг каждой сделки: подписи по Trade.id и версии (журнал, календарь), для которых они посчитаны
+        self._trade_events = {}
+        self._trade_events_version = None
 
         # Настройки API
         self.ai_model = "meta-llama/llama-3.3-70b-instruct:free"
-        self.base_url = "https://openrouter.ai/api/v1"
+        # Адрес можно переопределить, например, на локальную заглушку chat/completions
+        self.base_url = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
 
     def _load_and_index_trades(self):
         """Загрузка и векторная индексация сделок из БД"""
         print("📊 Загрузка сделок из базы данных...")
-        self.all_trades = self.db.query(Trade).order_by(Trade.date.desc()).all()
-
-        if not self.all_trades:
+        # Версия журнала читается до сделок: изменение между запросами только сделает снимок устаревшим
+        self._trade_index_version = self._journal_version()
+        # Только нужные колонки, без создания ORM объектов
+        trades = self.db.query(
+            Trade.id, Trade.date, Trade.symbol, Trade.direction, Trade.rr, Trade.risk, Trade.profit,
+            Trade.result_type, Trade.session, Trade.position, Trade.notes
+        ).filter(Trade.date.isnot(None)).all()
+
+        # Пустой индекс создаём всегда, чтобы в него можно было добавлять новые сделки
+        self.trade_index = create_index(self.index_type, self.dim)
+
+        if not trades:
             print("⚠️ В базе данных отсутствуют сделки")
             return
 
-        # Формирование текстовых описаний сделок
-        self.trade_texts = [
-            f"СДЕЛКА: Дата={trade.date.strftime('%Y-%m-%d')}, "
-            f"Символ={trade.symbol}, Направление={trade.direction}, "
-            f"R:R={trade.rr}, Профит=${trade.profit}, Результат={trade.result_type}, "
-            f"Сессия={trade.session}, Позиция={trade.position}, "
-            f"Комментарий={trade.notes or 'нет комментария'}"
-            for trade in self.all_trades
-        ]
+        self.trade_store.upsert(trades)
+        print(f"📈 Загружено {len(self.trade_store)} сделок")
 
-        print(f"📈 Загружено {len(self.trade_texts)} сделок")
+        # Тексты нужны только для эмбеддингов и не хранятся
+        trade_ids = self.trade_store.ids.tolist()
+        texts = self.trade_store.render(range(len(self.trade_store)))
+
+        # Тёплый старт: снимок индекса с тем же набором сделок читается через mmap
+        snapshot_fingerprint = self._trade_fingerprint(trade_ids, texts)
+        snapshot = load_index_snapshot(self.trade_snapshot_path, snapshot_fingerprint, self._trade_index_version)
+        if snapshot is not None:
+            self.trade_index = snapshot
+            self._trade_index_mmapped = True
+            print("✅ Векторный индекс сделок загружен из снимка")
+            return
 
         # Построение векторного индекса для сделок
-        embeddings = [
-            self.embedding_model.encode(text, convert_to_numpy=True).astype("float32")
-            for text in self.trade_texts
-        ]
+        embeddings_array = self._embed_texts(texts)
+        self.trade_index = build_index(self.index_type, self.dim, embeddings_array, trade_ids)
+        save_index_snapshot(self.trade_index, self.trade_snapshot_path, snapshot_fingerprint, self._trade_index_version)
+        print(f"✅ Векторный индекс сделок построен ({index_kind(self.trade_index)})")
+
+    def _trade_fingerprint(self, trade_ids, texts) -> str:
+        """Отпечаток индекса сделок: тип индекса и пары (Trade.id, хеш текста) в порядке id"""
+        return fingerprint(
+            [f"index:{self.index_type}"] +
+            [f"{trade_id}:{self.embedding_store.text_key(text)}" for trade_id, text in sorted(zip(trade_ids, texts))]
+        )
+
+    @staticmethod
+    def _journal_version() -> Optional[int]:
+        """Версия журнала для снимка индекса; None, если БД недоступна (снимок с ней не загрузится)"""
+        try:
+            return journal_version()
+        except Exception as e:
+            print(f"⚠️ Не удалось прочитать версию журнала: {e}")
+            return None
 
-        if embeddings:
-            embeddings_array = np.vstack(embeddings)
-            self.trade_index = faiss.IndexFlatL2(self.dim)
-            self.trade_index.add(embeddings_array)
-            print("✅ Векторный индекс сделок построен")
+    def _schedule_trade_snapshot(self):
+        """
+        Отложенное сохранение снимка после изменения сделок: серия изменений подряд
+        даёт одну запись через snapshot_delay секунд после последнего
+        """
+        version = self._journal_version()
+        with self._snapshot_lock:
+            self._trade_index_version = version
+            if self._snapshot_timer is not None:
+                self._snapshot_timer.cancel()
+            self._snapshot_timer = threading.Timer(self.snapshot_delay, self.save_trade_snapshot)
+            self._snapshot_timer.daemon = True
+            self._snapshot_timer.start()
+
+    def save_trade_snapshot(self):
+        """Сохраняет снимок индекса сделок, если есть несохранённые изменения (по таймеру и при выходе)"""
+        with self._snapshot_lock:
+            timer, self._snapshot_timer = self._snapshot_timer, None
+            version = self._trade_index_version
+        if timer is None:
+            return
+        timer.cancel()
 
-    def _load_news_data(self):
-        """Загрузка и индексация новостей через ForexNewsProvider"""
         try:
-            # Инициализация провайдера
-            provider = ForexNewsProvider()
+            # Копия индекса и набор сделок берутся согласованно, запись на диск - без блокировки поиска
+            with self._index_lock:
+                index = faiss.clone_index(self.trade_index)
+                trade_ids = self.trade_store.ids.tolist()
+                texts = self.trade_store.render(range(len(self.trade_store)))
+            save_index_snapshot(index, self.trade_snapshot_path, self._trade_fingerprint(trade_ids, texts), version)
+            print(f"💾 Снимок индекса сделок сохранён ({len(trade_ids)} сделок, версия журнала {version})")
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить снимок индекса сделок: {e}")
+
+    def _ensure_mutable_trade_index(self):
+        """Снимок, открытый через mmap, доступен только для чтения - копируем его в память перед изменением"""
+        if self._trade_index_mmapped:
+            self.trade_index = faiss.deserialize_index(faiss.serialize_index(self.trade_index))
+            self._trade_index_mmapped = False
+
+    def _rebuild_trade_index(self):
+        """Перестроение индекса сделок из кеша эмбеддингов (для индексов без remove_ids, например HNSW)"""
+        texts = self.trade_store.render(range(len(self.trade_store)))
+        embeddings_array = self._embed_texts(texts)
+        self.trade_index = build_index(self.index_type, self.dim, embeddings_array, self.trade_store.ids)
+        self._trade_index_mmapped = False
+
+    def upsert_trades(self, trades: Iterable[Trade]):
+        """
+        Добавление или обновление сделок в индексе без перестройки.
+        Кодируются только новые тексты, остальные берутся из кеша эмбеддингов.
+        """
+        trades = [trade for trade in trades if trade.date is not None]
+        if not trades:
+            return
 
-            # Получаем все новости (top_k=None)
-            news_data = provider.get_latest_news(top_k=None)
+        trade_ids = np.asarray([trade.id for trade in trades], dtype="int64")
+        with self._index_lock:
+            replaced = len(self.trade_store.rows_for_ids(trade_ids))
+            self.trade_store.upsert(trades)
+            texts = self.trade_store.render(self.trade_store.rows_for_ids(trade_ids))
+
+        # Кодирование вне блокировки, чтобы не задерживать параллельный поиск
+        embeddings_array = self._embed_texts(texts)
+
+        with self._index_lock:
+            self._ensure_mutable_trade_index()
+            if supports_remove(self.trade_index):
+                self.trade_index.remove_ids(trade_ids)
+                self.trade_index.add_with_ids(embeddings_array, trade_ids)
+            elif replaced:
+                self._rebuild_trade_index()
+            else:
+                self.trade_index.add_with_ids(embeddings_array, trade_ids)
+
+        self.response_cache.clear()
+        self._schedule_trade_snapshot()
+        print(f"🔄 Индекс сделок обновлён: {len(trades)} сделок добавлено/изменено")
+
+    def remove_trades(self, trade_ids: Iterable[int]):
+        """Удаление сделок из индекса по Trade.id"""
+        with self._index_lock:
+            rows = self.trade_store.rows_for_ids(trade_ids)
+            if not len(rows):
+                return
+            trade_ids = self.trade_store.ids[rows]
 
+            self._ensure_mutable_trade_index()
+            self.trade_store.remove(trade_ids)
+            if supports_remove(self.trade_index):
+                self.trade_index.remove_ids(trade_ids)
+            else:
+                self._rebuild_trade_index()
+
+        self.response_cache.clear()
+        self._schedule_trade_snapshot()
+        print(f"🔄 Из индекса сделок удалено {len(trade_ids)} сделок")
+
+    def _load_news_data(self):
+        """
+        Индексация новостей общего ForexNewsProvider.
+        Провайдер обновляется в фоне, поэтому индекс перестраивается по его уведомлениям
+        """
+        provider = get_news_provider()
+        provider.subscribe(self._on_news_update)
+        self._on_news_update(provider.get_latest_news(top_k=None))
+
+    @staticmethod
+    def _news_id(news: dict) -> int:
+        """Стабильный id события для FAISS: хеш ключа (дата, заголовок, страна)"""
+        digest = hashlib.sha1("\x00".join(str(part) for part in news_key(news)).encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") & ((1 << 63) - 1)
+
+    @staticmethod
+    def _news_text(news: dict) -> str:
+        """Текстовое описание новости для эмбеддинга; в промпт идут компактные строки _news_row"""
+        return (
+            f"НОВОСТЬ: Дата={news.get('date')}, Заголовок={news.get('title')}, "
+            f"Источник=ForexFactory, Важность={news.get('impact')}, "
+            f"Прогноз={news.get('forecast', 'нет данных')}, "
+            f"Предыдущее={news.get('previous', 'нет данных')}, "
+            f"Фактическое={news.get('actual', 'ещё не вышло')}"
+        )
+
+    def _on_news_update(self, news_data: list):
+        """
+        Инкрементальное обновление индекса новостей; вызывается при старте и из потока планировщика.
+        События сравниваются по стабильному ключу - перекодируются только новые и изменённые
+        (например, вышло фактическое значение), исчезнувшие удаляются из индекса
+        """
+        try:
             if not news_data:
                 print("📰 Новости не загружены")
                 return
 
-            # Формируем текстовые описания новостей для AI
-            self.news_texts = [
-                f"НОВОСТЬ: Дата={news.get('date')}, Заголовок={news.get('title')}, "
-                f"Источник=ForexFactory, Важность={news.get('impact')}, "
-                f"Прогноз={news.get('forecast', 'нет данных')}, "
-                f"Предыдущее={news.get('previous', 'нет данных')}, "
-                f"Фактическое={news.get('actual', 'ещё не вышло')}"
-                for news in news_data
-            ]
+            with self._news_update_lock:
+                fresh_items = {self._news_id(news): news for news in news_data}
+                fresh_texts = {news_id: self._news_text(news) for news_id, news in fresh_items.items()}
 
-            # Создание векторных эмбеддингов и FAISS индекса
-            embeddings = [
-                self.embedding_model.encode(text, convert_to_numpy=True).astype("float32")
-                for text in self.news_texts
-            ]
+                with self._index_lock:
+                    old_texts = self.news_texts
+                    rebuild = self.news_index is None or not supports_remove(self.news_index)
+
+                removed = [news_id for news_id in old_texts if news_id not in fresh_texts]
+                changed = [news_id for news_id, text in fresh_texts.items() if old_texts.get(news_id) != text]
+                if not removed and not changed:
+                    return
 
-            if embeddings:
-                embeddings_array = np.vstack(embeddings)
-                self.news_index = faiss.IndexFlatL2(self.dim)
-                self.news_index.add(embeddings_array)
-                print(f"📰 Проиндексировано {len(news_data)} новостей")
+                # Кодирование вне блокировки поиска; неизменённые тексты берутся из кеша эмбеддингов
+                if rebuild:
+                    ids = list(fresh_texts)
+                    news_index = build_index(self.index_type, self.dim,
+                                             self._embed_texts([fresh_texts[news_id] for news_id in ids]), ids)
+                else:
+                    embeddings_array = self._embed_texts([fresh_texts[news_id] for news_id in changed])
+
+                # Индекс и тексты меняются вместе, чтобы поиск не увидел их рассогласованными
+                with self._index_lock:
+                    if rebuild:
+                        self.news_index = news_index
+                    else:
+                        self.news_index.remove_ids(np.asarray(removed + changed, dtype="int64"))
+                        if changed:
+                            self.news_index.add_with_ids(embeddings_array, np.asarray(changed, dtype="int64"))
+                    self.news_items = fresh_items
+                    self.news_texts = fresh_texts
+
+            self.response_cache.clear()
+            print(f"📰 Индекс новостей обновлён: {len(fresh_items)} событий "
+                  f"(новых/изменённых {len(changed)}, удалено {len(removed)})")
 
         except Exception as e:
             print(f"⚠️ Ошибка загрузки новостей: {e}")
+        finally:
+            # Календарь обновляется вместе с новостями - соединение сделок с ним
+            # пересчитываем сразу, а не на первом запросе к AI
+            self._trade_event_labels()
 
     def _extract_date_from_query(self, user_query: str) -> Optional[str]:
         """Извлечение даты из текстового запроса"""
@@ -166,20 +465,85 @@ class AI_Client:
                 continue
         return None
 
-    def _find_trades_by_date(self, date_str: str) -> List[str]:
-        """Поиск сделок по конкретной дате"""
+    def _find_trades_by_date(self, date_str: str, filters: dict = None, query: str = None) -> List[str]:
+        """
+        Поиск сделок по конкретной дате (с учётом остальных структурных фильтров).
+        Если передан запрос, сделки упорядочиваются по релевантности - лишние потом отсечёт бюджет контекста
+        """
         normalized_date = self._normalize_date(date_str)
         if not normalized_date:
             return []
 
-        found_trades = []
-        for trade_text in self.trade_texts:
-            # Извлечение даты из описания сделки
-            date_match = re.search(r'Дата=([^,]+)', trade_text)
-            if date_match and date_match.group(1) == normalized_date:
-                found_trades.append(trade_text)
+        day = datetime.strptime(normalized_date, '%Y-%m-%d').date()
+        filters = dict(filters or {}, date_from=day, date_to=day)
+        with self._index_lock:
+            trade_ids = self.trade_store.ids[self.trade_store.select(**filters)]
+
+        if query and len(trade_ids) > 1:
+            ranked = self._rank_trade_ids(query, len(trade_ids), trade_ids)
+            # Приближённые индексы могут вернуть не все id - остальные идут следом в порядке дат
+            trade_ids = np.concatenate([ranked, trade_ids[~np.isin(trade_ids, ranked)]])
 
-        return found_trades
+        with self._index_lock:
+            return self._render_trades(self.trade_store.rows_for_ids(trade_ids))
+
+    def _extract_date_range(self, user_query: str):
+        """Диапазон дат из запроса: "с 01.07.2025 по 10.07.2025" или "за последние 2 недели" """
+        query_lower = user_query.lower()
+
+        range_match = re.search(self.RANGE_PATTERN, query_lower)
+        if range_match:
+            date_from = self._normalize_date(range_match.group(1).strip('.'))
+            date_to = self._normalize_date(range_match.group(2).strip('.'))
+            if date_from and date_to:
+                return (datetime.strptime(date_from, '%Y-%m-%d').date(),
+                        datetime.strptime(date_to, '%Y-%m-%d').date())
+
+        period_match = re.search(self.PERIOD_PATTERN, query_lower)
+        if period_match:
+            count = int(period_match.group(1) or 1)
+            days = count * self.PERIOD_DAYS[period_match.group(2)[:2]]
+            return date.today() - timedelta(days=days), None
+
+        return None, None
+
+    def _extract_trade_filters(self, user_query: str) -> dict:
+        """
+        Структурные ограничения из запроса, совпадающие с колонками Trade.
+        Учитываются только значения, которые реально есть в журнале
+        """
+        query_lower = user_query.lower()
+        filters = {}
+
+        # Символ: известные символы журнала целыми словами запроса, "EUR/USD" == "EURUSD" -
+        # поэтому сравниваем и со склейками 2-3 соседних слов
+        tokens = re.findall(r'\w+', user_query.casefold())
+        phrases = {"".join(tokens[start:end]) for start in range(len(tokens))
+                   for end in range(start + 1, min(start + 3, len(tokens)) + 1)}
+        symbols = []
+        for symbol in self.trade_store.vocab["symbol"].values:
+            # Символ без букв и цифр (после нормализации пустой) ни с чем не сравниваем
+            normalized = re.sub(r'[\W_]+', '', symbol.casefold()) if symbol else ''
+            if normalized and normalized in phrases:
+                symbols.append(symbol)
+        if symbols:
+            filters["symbol"] = max(symbols, key=len)
+
+        for column, values in self.FILTER_KEYWORDS.items():
+            for canonical, patterns in values.items():
+                if any(re.search(pattern, query_lower) for pattern in patterns):
+                    known = self.trade_store.vocab[column].match(canonical)
+                    if known is not None:
+                        filters[column] = known
+                    break
+
+        date_from, date_to = self._extract_date_range(user_query)
+        if date_from:
+            filters["date_from"] = date_from
+        if date_to:
+            filters["date_to"] = date_to
+
+        return filters
 
     def _get_trade_count_from_query(self, user_query: str) -> int:
         """Определение количества запрашиваемых сделок"""
@@ -194,8 +558,8 @@ class AI_Client:
         count_mapping = {
             'несколько': 3, 'немного': 3, 'пару': 2,
             'десяток': 10, 'около десяти': 10,
-            'много': 8, 'все': min(15, len(self.trade_texts)),
-            'полный': min(15, len(self.trade_texts))
+            'много': 8, 'все': min(15, len(self.trade_store)),
+            'полный': min(15, len(self.trade_store))
         }
 
         for keyword, count in count_mapping.items():
@@ -204,39 +568,91 @@ class AI_Client:
 
         return 5  # Значение по умолчанию
 
-    def _search_relevant_trades(self, query: str, top_k: int = 5) -> List[str]:
-        """Семантический поиск релевантных сделок"""
-        if not self.trade_index or not self.trade_texts:
-            return []
-
+    def _rank_trade_ids(self, query: str, top_k: int, candidate_ids=None) -> np.ndarray:
+        """Trade.id по убыванию релевантности (только среди candidate_ids, если они заданы)"""
         try:
-            query_embedding = self.embedding_model.encode(query, convert_to_numpy=True)
-            query_embedding = query_embedding.astype("float32").reshape(1, -1)
+            query_embedding = self._embed_query(query)
 
-            distances, indices = self.trade_index.search(query_embedding, top_k)
+            with self._index_lock:
+                exhaustive = is_exhaustive(self.trade_index)
+            if candidate_ids is not None and not exhaustive:
+                return self._rank_candidates_exact(query_embedding, top_k, candidate_ids)
 
-            return [
-                self.trade_texts[idx] for idx in indices[0]
-                if 0 <= idx < len(self.trade_texts)
-            ]
+            # FAISS проверяет только id из отфильтрованного подмножества
+            selector = faiss.IDSelectorBatch(candidate_ids) if candidate_ids is not None else None
+
+            with self._index_lock:
+                params = search_params(self.trade_index, selector)
+                distances, trade_ids = self.trade_index.search(query_embedding, top_k, params=params)
+            return trade_ids[0][trade_ids[0] >= 0]
         except Exception as e:
             print(f"❌ Ошибка семантического поиска сделок: {e}")
+            return np.empty(0, dtype="int64")
+
+    def _rank_candidates_exact(self, query_embedding: np.ndarray, top_k: int, candidate_ids) -> np.ndarray:
+        """
+        Точный поиск только среди кандидатов: их векторы берутся из кеша эмбеддингов
+        и сравниваются с запросом во временном Flat индексе с той же метрикой, что и основной
+        """
+        with self._index_lock:
+            rows = self.trade_store.rows_for_ids(candidate_ids)
+            trade_ids = self.trade_store.ids[rows]
+            texts = self.trade_store.render(rows)
+            metric = self.trade_index.metric_type
+        if not len(trade_ids):
+            return np.empty(0, dtype="int64")
+
+        index = faiss.IndexFlat(self.dim, metric)
+        index.add(self._embed_texts(texts))
+        distances, positions = index.search(query_embedding, min(top_k, len(trade_ids)))
+        return trade_ids[positions[0][positions[0] >= 0]]
+
+    def _search_relevant_trades(self, query: str, top_k: int = 5, rows=None) -> List[str]:
+        """
+        Семантический поиск релевантных сделок.
+        :param rows: строки TradeColumns после структурных фильтров - поиск идёт только среди них
+        """
+        if self.trade_index is None or not len(self.trade_store):
             return []
 
+        candidate_ids = None
+        with self._index_lock:
+            if rows is not None:
+                if not len(rows):
+                    return []
+                if len(rows) <= top_k:
+                    # Все подходящие сделки и так попадут в контекст - ранжировать нечего
+                    return self._render_trades(rows[::-1])
+                candidate_ids = self.trade_store.ids[rows]
+
+        trade_ids = self._rank_trade_ids(query, top_k, candidate_ids)
+
+        if candidate_ids is not None and len(trade_ids) < top_k:
+            # Если поиск вернул меньше top_k (например, ошибка эмбеддинга), добираем
+            # подходящие сделки от новых к старым, как в _find_trades_by_date
+            rest = candidate_ids[::-1][~np.isin(candidate_ids[::-1], trade_ids)]
+            trade_ids = np.concatenate([trade_ids, rest[:top_k - len(trade_ids)]])
+
+        # Порядок релевантности сохраняется, строки рендерятся только для найденных сделок
+        with self._index_lock:
+            return self._render_trades(self.trade_store.rows_for_ids(trade_ids))
+
     def _search_relevant_news(self, query: str, top_k: int = 15) -> List[str]:
-        """Семантический поиск релевантных новостей"""
-        if not self.news_index or not self.news_texts:
+        """Семантический поиск релевантных новостей (строки компактной таблицы)"""
+        # Согласованный снимок: индекс может подмениться из потока планировщика новостей
+        with self._index_lock:
+            news_index, news_items = self.news_index, self.news_items
+        if not news_index or not news_items:
             return []
 
         try:
-            query_embedding = self.embedding_model.encode(query, convert_to_numpy=True)
-            query_embedding = query_embedding.astype("float32").reshape(1, -1)
+            query_embedding = self._embed_query(query)
 
-            distances, indices = self.news_index.search(query_embedding, top_k)
+            distances, indices = news_index.search(query_embedding, top_k, params=search_params(news_index))
 
             return [
-                self.news_texts[idx] for idx in indices[0]
-                if 0 <= idx < len(self.news_texts)
+                self._news_row(news_items[news_id]) for news_id in indices[0].tolist()
+                if news_id in news_items
             ]
         except Exception as e:
             print(f"❌ Ошибка поиска новостей: {e}")
@@ -244,14 +660,72 @@ class AI_Client:
 
     def _get_latest_trades(self, n: int) -> List[str]:
         """Получение последних сделок по хронологии"""
-        return self.trade_texts[:n]
+        with self._index_lock:
+            return self._render_trades(self.trade_store.latest(n))
+
+    # Компактная таблица новостей для промпта
+    NEWS_HEADER = "Дата|Событие|Важность|Прогноз|Предыдущее|Фактическое"
+
+    def _render_trades(self, rows) -> List[str]:
+        """Компактные строки сделок с колонкой новостей вокруг сделки"""
+        return self.trade_store.render_compact(rows, events=self._trade_event_labels())
+
+    def _trade_event_labels(self) -> dict:
+        """
+        Важные новости USD в окне ±CALENDAR_WINDOW_HOURS вокруг каждой сделки журнала.
+        Соединение считается сразу для всего журнала и пересчитывается, только когда
+        меняются сделки или календарь (его версия хранится в базе и общая для всех процессов)
+        """
+        calendar = get_calendar_store()
+        try:
+            version = (self.trade_store.version, calendar.version)
+        except Exception as e:
+            print(f"⚠️ Не удалось прочитать версию календаря: {e}")
+            return self._trade_events
+
+        with self._index_lock:
+            if self._trade_events_version == version:
+                return self._trade_events
+
+            store = self.trade_store
+            sessions = store.codes["session"].tolist()
+            anchors = [
+                (trade_id, trade_anchor(date.fromordinal(day), store.vocab["session"].value(code)))
+                for trade_id, day, code in zip(store.ids.tolist(), store.date_ord.tolist(), sessions)
+            ]
+            try:
+                joined = calendar.events_near(anchors)
+            except Exception as e:
+                print(f"⚠️ Не удалось сопоставить сделки с календарём: {e}")
+                joined = {}
+
+            self._trade_events = {
+                trade_id: "; ".join(f"{event['title']} ({event['offset_hours']:+g}ч)" for event in events)
+                for trade_id, events in joined.items()
+            }
+            self._trade_events_version = version
+            return self._trade_events
+
+    @staticmethod
+    def _news_row(news: dict) -> str:
+        return "|".join([
+            table_cell(news.get('date')),
+            table_cell(news.get('title')),
+            table_cell(news.get('impact')),
+            table_cell(news.get('forecast')),
+            table_cell(news.get('previous')),
+            table_cell(news.get('actual') or 'ещё не вышло'),
+        ])
 
     def _classify_query_intent(self, user_query: str) -> dict:
         """Классификация намерения пользователя"""
         query_lower = user_query.lower()
 
-        # Проверка на наличие даты в запросе
-        has_date = self._extract_date_from_query(user_query) is not None
+        # Структурные фильтры (символ, сессия, позиция, результат, период)
+        filters = self._extract_trade_filters(user_query)
+
+        # Проверка на наличие конкретной даты в запросе (диапазон дат обрабатывается фильтрами)
+        has_date = self._extract_date_from_query(user_query) is not None and "date_from" not in filters
 
         # Ключевые слова для классификации
         intent_patterns = {
@@ -270,7 +744,7 @@ class AI_Client:
 
         # Определение необходимости данных
         needs_trades = any(word in query_lower for word in
-                           ['сделк', 'последн', 'недавн', 'мои', 'журнал', 'истори']) or has_date
+                           ['сделк', 'последн', 'недавн', 'мои', 'журнал', 'истори']) or has_date or bool(filters)
 
         needs_news = intent == "news" or any(word in query_lower for word in
                                              ['новости', 'события', 'экономика'])
@@ -280,47 +754,127 @@ class AI_Client:
             "needs_trades": needs_trades,
             "needs_news": needs_news,
             "has_date": has_date,
+            "filters": filters,
             "is_general_question": not needs_trades and not needs_news and intent in ["psychology", "general"]
         }
 
-    def _call_ai_api(self, prompt: str) -> str:
-        """Вызов внешнего AI API"""
-        if not self.api_key:
-            return "❌ Отсутствует API ключ для доступа к AI"
+    def _post_chat_completion(self, prompt: str, api_key: str, stream: bool = False) -> requests.Response:
+        """HTTP запрос к chat/completions (в потоковом режиме тело читается по мере генерации)"""
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "http://localhost:5000",
+            "X-Title": "Trade Analysis AI"
+        }
 
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "http://localhost:5000",
-                "X-Title": "Trade Analysis AI"
-            }
+        payload = {
+            "model": self.ai_model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 2000,
+            "temperature": 0.7,
+        }
+        if stream:
+            payload["stream"] = True
+
+        response = requests.post(
+            f"{self.base_url}/chat/completions",
+            json=payload,
+            headers=headers,
+            timeout=60,
+            stream=stream
+        )
+
+        if response.status_code != 200:
+            try:
+                error_msg = response.json().get('error', {}).get('message', 'Unknown error')
+            except ValueError:
+                error_msg = response.text[:200] or 'Unknown error'
+            response.close()
+            raise Exception(f"API Error {response.status_code}: {error_msg}")
 
-            payload = {
-                "model": self.ai_model,
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": 2000,
-                "temperature": 0.7,
-            }
+        return response
 
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                json=payload,
-                headers=headers,
-                timeout=60
-            )
+    def _request_completion(self, prompt: str, api_key: str) -> str:
+        """Полный ответ модели (исключения пробрасываются, чтобы ошибки не попадали в кеш)"""
+        data = self._post_chat_completion(prompt, api_key).json()
+        return data["choices"][0]["message"]["content"].strip()
 
-            if response.status_code != 200:
-                error_msg = response.json().get('error', {}).get('message', 'Unknown error')
-                raise Exception(f"API Error {response.status_code}: {error_msg}")
+    def _call_ai_api(self, prompt: str, api_key: str) -> str:
+        """Вызов внешнего AI API с ключом текущего запроса (через кеш ответов)"""
+        if not api_key:
+            return "❌ Отсутствует API ключ для доступа к AI"
 
-            data = response.json()
-            return data["choices"][0]["message"]["content"].strip()
+        try:
+            key = ResponseCache.make_key(self.ai_model, prompt)
+            return self.response_cache.get_or_compute(key, lambda: self._request_completion(prompt, api_key))
 
         except Exception as e:
             print(f"❌ Ошибка вызова AI API: {e}")
             return f"⚠️ Временная недоступность AI сервиса. Пожалуйста, повторите запрос позже."
 
+    def _call_ai_api_stream(self, prompt: str, api_key: str) -> Iterator[str]:
+        """
+        Потоковый вызов AI API через кеш ответов.
+        Готовый или параллельно выполняющийся ответ отдаётся одним фрагментом
+        """
+        if not api_key:
+            yield "❌ Отсутствует API ключ для доступа к AI"
+            return
+
+        key = ResponseCache.make_key(self.ai_model, prompt)
+        cached = self.response_cache.get(key)
+        if cached:
+            yield cached
+            return
+
+        flight, is_leader = self.response_cache.begin(key)
+        if not is_leader:
+            try:
+                yield self.response_cache.wait(flight)
+            except Exception as e:
+                print(f"❌ Ошибка вызова AI API: {e}")
+                yield "⚠️ Временная недоступность AI сервиса. Пожалуйста, повторите запрос позже."
+            return
+
+        chunks = []
+        error = None
+        try:
+            for delta in self._stream_completion(prompt, api_key):
+                chunks.append(delta)
+                yield delta
+        except GeneratorExit:
+            # Клиент отключился - ожидающие запросы не должны получить обрезанный ответ
+            error = ConnectionAbortedError("Потоковый ответ прерван клиентом")
+            raise
+        except Exception as e:
+            error = e
+            print(f"❌ Ошибка потокового вызова AI API: {e}")
+            yield "\n\n⚠️ Временная недоступность AI сервиса. Пожалуйста, повторите запрос позже."
+        finally:
+            self.response_cache.finish(key, flight, value="".join(chunks).strip(), error=error)
+
+    def _stream_completion(self, prompt: str, api_key: str) -> Iterator[str]:
+        """Фрагменты ответа модели по мере генерации (SSE от OpenRouter)"""
+        with self._post_chat_completion(prompt, api_key, stream=True) as response:
+            response.encoding = "utf-8"
+            for line in response.iter_lines(decode_unicode=True):
+                # Пустые строки разделяют события, строки с ":" - комментарии keep-alive
+                if not line or not line.startswith("data:"):
+                    continue
+
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+
+                chunk = json.loads(data)
+                if chunk.get("error"):
+                    raise Exception(chunk["error"].get("message", "Unknown error"))
+
+                choices = chunk.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+
     def _clean_response(self, text: str) -> str:
         """Очистка и форматирование ответа AI"""
         # Удаление избыточных пробелов и переносов
@@ -328,18 +882,20 @@ class AI_Client:
         text = re.sub(r'[ \t]+', ' ', text)
         return text.strip()
 
-    def _create_adaptive_prompt(self, user_query: str, trades: List[str], query_intent: dict) -> str:
-        """Создание адаптивного промпта для анализа сделок"""
-        if not trades and query_intent["needs_trades"]:
+    def _create_adaptive_prompt(self, user_query: str, trades_context: str, query_intent: dict) -> str:
+        """
+        Создание адаптивного промпта для анализа сделок
+        :param trades_context: таблица сделок, уже уложенная в бюджет токенов
+        """
+        if not trades_context and query_intent["needs_trades"]:
             return self._create_no_data_prompt(user_query)
 
-        trades_context = "\n".join([f"{i + 1}. {trade}" for i, trade in enumerate(trades)])
-
         # Базовый контекст для AI
         base_context = f"""
 Пользовательский запрос: "{user_query}"
 
-Контекст сделок:
+Контекст сделок (таблица, столбцы разделены "|", "-" - нет данных; "Новости" - важные новости USD
+в пределах ±{CALENDAR_WINDOW_HOURS:g}ч от открытия сессии сделки, в скобках - смещение от открытия в часах):
 {trades_context}
 """
 
@@ -378,9 +934,12 @@ class AI_Client:
 """
         return prompt
 
-    def _create_news_prompt(self, user_query: str, news: List[str]) -> str:
-        """Создание промпта для анализа новостей"""
-        if not news:
+    def _create_news_prompt(self, user_query: str, news_context: str) -> str:
+        """
+        Создание промпта для анализа новостей
+        :param news_context: таблица новостей, уже уложенная в бюджет токенов
+        """
+        if not news_context:
             return f"""
 Пользователь запросил: "{user_query}"
 
@@ -392,12 +951,10 @@ class AI_Client:
 - Обратиться к другим аспектам трейдинга
 """
 
-        news_context = "\n".join([f"{i + 1}. {item}" for i, item in enumerate(news)])
-
         return f"""
 Ты - опытный финансовый аналитик. Пользователь запросил: "{user_query}"
 
-Актуальные новости для анализа:
+Актуальные новости для анализа (таблица, столбцы разделены "|", источник ForexFactory):
 {news_context}
 
 Проанализируй эти новости и:
@@ -424,11 +981,35 @@ class AI_Client:
 Будь поддерживающим и предложи альтернативные варианты помощи.
 """
 
-    def analyze(self, user_query: str) -> str:
+    def analyze(self, user_query: str, api_key: str, prompt: str = None) -> str:
         """
         Универсальный метод анализа (сделки + новости)
+        :param api_key: ключ OpenRouter пользователя, используется только для этого вызова
+        :param prompt: промпт, заранее собранный build_prompt() (чтобы вызывающий код получил расход токенов)
+        """
+        if prompt is None:
+            prompt, _ = self.build_prompt(user_query)
+
+        print("🚀 Генерация AI ответа...")
+        response = self._call_ai_api(prompt, api_key)
+        return self._clean_response(response)
+
+    def analyze_stream(self, user_query: str, api_key: str, prompt: str = None) -> Iterator[str]:
+        """Тот же анализ, но ответ отдаётся фрагментами по мере генерации"""
+        if prompt is None:
+            prompt, _ = self.build_prompt(user_query)
+
+        print("🚀 Потоковая генерация AI ответа...")
+        yield from self._call_ai_api_stream(prompt, api_key)
+
+    def build_prompt(self, user_query: str, token_budget: int = None) -> Tuple[str, dict]:
+        """
+        Поиск контекста и сборка промпта под намерение пользователя.
+        Кандидаты (по убыванию релевантности) укладываются в бюджет токенов контекста.
+        Возвращает (промпт, расход токенов)
         """
         print(f"🎯 Обработка запроса: '{user_query}'")
+        budget = resolve_budget(token_budget)
 
         # Анализ намерения пользователя
         query_intent = self._classify_query_intent(user_query)
@@ -437,27 +1018,37 @@ class AI_Client:
         # Выбор стратегии анализа
         if query_intent["needs_news"]:
             print("📰 Анализ новостей...")
-            relevant_news = self._search_relevant_news(user_query, top_k=15)
-            print(f"📊 Найдено новостей для анализа: {len(relevant_news)}")
-            prompt = self._create_news_prompt(user_query, relevant_news)
+            candidates = self._search_relevant_news(user_query, top_k=30)
+            print(f"📊 Найдено новостей для анализа: {len(candidates)}")
+            context, packed, context_tokens = pack_rows(self.NEWS_HEADER, candidates, budget)
+            prompt = self._create_news_prompt(user_query, context)
         else:
             # Анализ сделок
-            relevant_trades = self._find_relevant_trades(user_query, query_intent)
-            print(f"📊 Найдено сделок для анализа: {len(relevant_trades)}")
-            prompt = self._create_adaptive_prompt(user_query, relevant_trades, query_intent)
-
-        print("🚀 Генерация AI ответа...")
-        response = self._call_ai_api(prompt)
-        return self._clean_response(response)
+            candidates = self._find_relevant_trades(user_query, query_intent)
+            print(f"📊 Найдено сделок для анализа: {len(candidates)}")
+            context, packed, context_tokens = pack_rows(self.trade_store.COMPACT_HEADER, candidates, budget)
+            prompt = self._create_adaptive_prompt(user_query, context, query_intent)
+
+        usage = {
+            "budget": budget,
+            "context_tokens": context_tokens,
+            "prompt_tokens": estimate_tokens(prompt),
+            "candidates": len(candidates),
+            "packed": packed,
+        }
+        print(f"🧮 Контекст: {context_tokens}/{budget} токенов, {packed} из {len(candidates)} записей, "
+              f"промпт ~{usage['prompt_tokens']} токенов")
+        return prompt, usage
 
     def _find_relevant_trades(self, user_query: str, query_intent: dict) -> List[str]:
         """Интеллектуальный поиск релевантных сделок"""
+        filters = query_intent.get("filters") or {}
 
         # Приоритетный поиск по дате
         if query_intent["has_date"]:
             extracted_date = self._extract_date_from_query(user_query)
             if extracted_date:
-                date_trades = self._find_trades_by_date(extracted_date)
+                date_trades = self._find_trades_by_date(extracted_date, filters, query=user_query)
                 if date_trades:
                     print(f"📅 Найдено сделок по дате {extracted_date}: {len(date_trades)}")
                     return date_trades
@@ -466,11 +1057,21 @@ class AI_Client:
 
         # Стандартные стратегии поиска
         if query_intent["needs_trades"]:
-            trade_count = self._get_trade_count_from_query(user_query)
+            # Числа из "за последние 2 недели" и "с ... по ..." - это период, а не количество сделок
+            count_query = re.sub(self.RANGE_PATTERN, '', user_query.lower())
+            trade_count = self._get_trade_count_from_query(re.sub(self.PERIOD_PATTERN, '', count_query))
+
+            rows = None
+            if filters:
+                rows = self.trade_store.select(**filters)
+                print(f"🧩 Фильтры {filters}: подходит {len(rows)} сделок")
 
             if any(word in user_query.lower() for word in ['последн', 'недавн']):
-                return self._get_latest_trades(trade_count)
+                if rows is None:
+                    return self._get_latest_trades(trade_count)
+                with self._index_lock:
+                    return self._render_trades(rows[::-1][:trade_count])
             else:
-                return self._search_relevant_trades(user_query, trade_count)
+                return self._search_relevant_trades(user_query, trade_count, rows=rows)
 
         return []  # Для общих вопросов не требуются сделки
\ No newline at end of file
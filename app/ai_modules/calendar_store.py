@@ -0,0 +1,220 @@
+import os
+import sqlite3
+import threading
+import logging
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Окно "новости вокруг сделки" в часах (± от времени сессии)
+CALENDAR_WINDOW_HOURS = float(os.getenv("CALENDAR_WINDOW_HOURS", "4"))
+
+# В журнале хранится только дата сделки, поэтому время берётся по открытию сессии (UTC)
+SESSION_HOURS_UTC = {"ASIA": 1, "LONDON": 8, "NY": 13}
+DEFAULT_SESSION_HOUR = 12
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    country    TEXT NOT NULL,
+    ts         INTEGER NOT NULL,
+    title      TEXT NOT NULL,
+    date       TEXT NOT NULL,
+    impact     TEXT,
+    forecast   TEXT,
+    previous   TEXT,
+    actual     TEXT,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (country, ts, title)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+"""
+
+_COLUMNS = ("country", "ts", "title", "date", "impact", "forecast", "previous", "actual")
+
+
+def trade_anchor(day: date, session: Optional[str] = None) -> int:
+    """UTC timestamp сделки: дата журнала + час открытия её сессии"""
+    hour = SESSION_HOURS_UTC.get((session or "").upper(), DEFAULT_SESSION_HOUR)
+    return int(datetime(day.year, day.month, day.day, hour, tzinfo=timezone.utc).timestamp())
+
+
+def parse_event_time(value) -> Optional[int]:
+    """UTC timestamp из ISO даты ForexFactory ("2025-07-14T08:30:00-04:00")"""
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+class CalendarStore:
+    """
+    История экономического календаря в локальной SQLite.
+
+    Ключ события - (страна, время, заголовок), как у news_key, поэтому
+    каждое обновление провайдера дописывает новые события и правит
+    прогноз/факт у существующих, а прошлые недели не теряются.
+    Одно обновление - одна транзакция. Таблица кластеризована по
+    (страна, время), так что выборка по валюте за период - это один
+    проход по диапазону ключа.
+    """
+
+    def __init__(self, path: str = "cache/calendar.db"):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Своё соединение на вызов: к хранилищу обращаются и поток планировщика, и веб-потоки
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @property
+    def version(self) -> int:
+        """
+        Счётчик изменений для кешей, построенных поверх календаря. Хранится в файле базы
+        (PRAGMA user_version), поэтому запись из другого процесса тоже меняет версию
+        """
+        conn = self._connect()
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+
+    def upsert(self, items: Iterable[dict]) -> int:
+        """
+        Запись событий одной транзакцией: новые добавляются, у известных
+        обновляются только изменившиеся поля. Возвращает число затронутых строк
+        """
+        now = int(datetime.now(timezone.utc).timestamp())
+        rows = []
+        for item in items:
+            ts = parse_event_time(item.get("date"))
+            if ts is None or not item.get("title") or not item.get("country"):
+                continue
+            rows.append((item.get("country"), ts, item.get("title"), item.get("date"), item.get("impact"),
+                         item.get("forecast") or None, item.get("previous") or None, item.get("actual") or None, now))
+        if not rows:
+            return 0
+
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    before = conn.total_changes
+                    conn.executemany(
+                        """
+                        INSERT INTO events (country, ts, title, date, impact, forecast, previous, actual, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (country, ts, title) DO UPDATE SET
+                            date = excluded.date,
+                            impact = excluded.impact,
+                            forecast = excluded.forecast,
+                            previous = excluded.previous,
+                            actual = COALESCE(excluded.actual, events.actual),
+                            updated_at = excluded.updated_at
+                        WHERE events.impact IS NOT excluded.impact
+                           OR events.forecast IS NOT excluded.forecast
+                           OR events.previous IS NOT excluded.previous
+                           OR (excluded.actual IS NOT NULL AND events.actual IS NOT excluded.actual)
+                        """,
+                        rows
+                    )
+                    changed = conn.total_changes - before
+                    if changed:
+                        # Версия растёт в той же транзакции, пока держится блокировка записи базы
+                        version = conn.execute("PRAGMA user_version").fetchone()[0]
+                        conn.execute(f"PRAGMA user_version = {int(version) + 1}")
+            finally:
+                conn.close()
+        return changed
+
+    def events_between(self, ts_from: int, ts_to: int, country: Optional[str] = None,
+                       impacts: Optional[Sequence[str]] = None) -> List[dict]:
+        """События в интервале [ts_from, ts_to] по возрастанию времени"""
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM events WHERE ts BETWEEN ? AND ?"
+        params = [int(ts_from), int(ts_to)]
+        if country:
+            sql += " AND country = ?"
+            params.append(country)
+        if impacts:
+            sql += f" AND impact IN ({', '.join('?' * len(impacts))})"
+            params.extend(impacts)
+        sql += " ORDER BY ts"
+
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    def events_near(self, anchors: Sequence[Tuple[int, int]], hours: float = None,
+                    country: str = "USD", impacts: Sequence[str] = ("High",)) -> Dict[int, List[dict]]:
+        """
+        События в окне ±hours вокруг каждой точки (ключ, UTC timestamp).
+
+        Весь журнал обрабатывается одним запросом по диапазону
+        [первая точка - окно, последняя + окно]; границы окна каждой точки
+        находятся бинарным поиском по отсортированным временам событий.
+        Возвращает {ключ: [событие, ...]} только для точек, рядом с которыми что-то было
+        """
+        if not anchors:
+            return {}
+        window = int((CALENDAR_WINDOW_HOURS if hours is None else hours) * 3600)
+
+        keys = [key for key, _ in anchors]
+        points = np.fromiter((ts for _, ts in anchors), dtype="int64", count=len(anchors))
+        events = self.events_between(points.min() - window, points.max() + window, country, impacts)
+        if not events:
+            return {}
+
+        times = np.fromiter((event["ts"] for event in events), dtype="int64", count=len(events))
+        starts = np.searchsorted(times, points - window, side="left")
+        ends = np.searchsorted(times, points + window, side="right")
+
+        result = {}
+        for key, point, start, end in zip(keys, points.tolist(), starts.tolist(), ends.tolist()):
+            if start < end:
+                result[key] = [dict(event, offset_hours=round((event["ts"] - point) / 3600, 1))
+                               for event in events[start:end]]
+        return result
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        try:
+            count, first, last = conn.execute("SELECT COUNT(*), MIN(ts), MAX(ts) FROM events").fetchone()
+        finally:
+            conn.close()
+        return {"events": count, "first_ts": first, "last_ts": last, "version": self.version}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_calendar_store() -> CalendarStore:
+    """Единое хранилище календаря на процесс (путь - CALENDAR_DB)"""
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = CalendarStore(os.getenv("CALENDAR_DB", os.path.join("cache", "calendar.db")))
+        return _store
+
+
+def event_time_utc(event: dict) -> str:
+    return datetime.fromtimestamp(event["ts"], tz=timezone.utc).strftime("%d.%m.%Y %H:%M UTC")
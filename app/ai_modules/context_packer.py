@@ -0,0 +1,66 @@
+import os
+import re
+from typing import Sequence, Tuple
+
+# Бюджет токенов на контекст (сделки или новости) одного запроса
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("AI_CONTEXT_TOKENS", "1500"))
+MIN_CONTEXT_TOKENS = 200
+MAX_CONTEXT_TOKENS = 8000
+
+_CYRILLIC = re.compile(r"[А-Яа-яЁё]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Оценка числа токенов без токенизатора модели.
+    Кириллица в BPE словарях дробится сильнее: ~2.5 символа на токен против ~4 для латиницы и цифр
+    """
+    if not text:
+        return 0
+    cyrillic = len(_CYRILLIC.findall(text))
+    return int(cyrillic / 2.5 + (len(text) - cyrillic) / 4) + 1
+
+
+def resolve_budget(token_budget=None) -> int:
+    """Бюджет запроса в допустимых пределах (по умолчанию AI_CONTEXT_TOKENS)"""
+    try:
+        budget = int(token_budget) if token_budget else DEFAULT_CONTEXT_TOKENS
+    except (TypeError, ValueError):
+        budget = DEFAULT_CONTEXT_TOKENS
+    return max(MIN_CONTEXT_TOKENS, min(budget, MAX_CONTEXT_TOKENS))
+
+
+def table_cell(value, limit: int = None) -> str:
+    """Значение ячейки таблицы: без переводов строк и разделителя, пустое - "-" """
+    if value is None or value == "":
+        return "-"
+    if isinstance(value, float):
+        text = f"{value:g}"
+    else:
+        text = " ".join(str(value).split()).replace("|", "/")
+    if limit and len(text) > limit:
+        text = text[:limit - 1] + "…"
+    return text
+
+
+def pack_rows(header: str, rows: Sequence[str], budget: int) -> Tuple[str, int, int]:
+    """
+    Таблица из строк в порядке релевантности, пока она укладывается в бюджет.
+    Строка, которая не помещается, пропускается - более короткие следующие ещё могут войти.
+    Возвращает (текст таблицы, число вошедших строк, токены)
+    """
+    if not rows:
+        return "", 0, 0
+
+    lines = [header]
+    used = estimate_tokens(header)
+    for row in rows:
+        cost = estimate_tokens(row) + 1  # + перевод строки
+        if used + cost > budget:
+            continue
+        lines.append(row)
+        used += cost
+
+    if len(lines) == 1:
+        return "", 0, 0
+    return "\n".join(lines), len(lines) - 1, used
@@ -0,0 +1,243 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+from contextlib import contextmanager
+import numpy as np
+import faiss
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только между потоками одного процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStore:
+    """
+    Дисковое хранилище эмбеддингов.
+
+    Ключ вектора - sha1 от имени модели и текста, поэтому повторно
+    кодируются только новые или изменённые тексты. Векторы хранятся
+    в append-only файле float32 и читаются через memmap.
+
+    Файлы могут дописывать несколько процессов (воркеры gunicorn):
+    запись идёт под flock, номер строки берётся из файлов на диске.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = "cache/embeddings"):
+        self.model_name = model_name
+        self.store_dir = os.path.join(cache_dir, _slugify(model_name))
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        self.vectors_file = os.path.join(self.store_dir, "vectors.f32")
+        self.keys_file = os.path.join(self.store_dir, "keys.txt")
+        self.meta_file = os.path.join(self.store_dir, "meta.json")
+        self.lock_file = os.path.join(self.store_dir, ".lock")
+
+        self.dim = None
+        self._rows = {}
+        # Строк векторов на диске, уже учтённых в _rows (ключи разных процессов могут повторяться)
+        self._count = 0
+        self._vectors = None
+        self._lock = threading.RLock()
+
+        self._load()
+
+    def text_key(self, text: str) -> str:
+        """Хеш текста вместе с именем модели"""
+        return hashlib.sha1(f"{self.model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key: str):
+        return key in self._rows
+
+    @contextmanager
+    def _file_lock(self):
+        """Межпроцессная блокировка файлов хранилища"""
+        with open(self.lock_file, "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self):
+        """Загрузка ключей и memmap векторов с диска"""
+        if not os.path.exists(self.meta_file):
+            return
+
+        try:
+            with self._file_lock():
+                self._sync_from_disk()
+            logger.info(f"Загружено {self._count} эмбеддингов из {self.store_dir}")
+        except Exception as e:
+            logger.error(f"Не удалось загрузить хранилище эмбеддингов: {e}")
+            self.dim = None
+            self._rows = {}
+            self._count = 0
+            self._vectors = None
+
+    def _sync_from_disk(self):
+        """
+        Подхватывает строки, дописанные другими процессами (вызывается под _file_lock).
+        Запись могла оборваться между векторами и ключами - такой хвост обрезается,
+        чтобы следующие векторы и ключи снова легли на одни и те же строки
+        """
+        if self.dim is None:
+            if not os.path.exists(self.meta_file):
+                return
+            with open(self.meta_file, "r", encoding="utf-8") as f:
+                self.dim = json.load(f).get("dim")
+
+        content = ""
+        if os.path.exists(self.keys_file):
+            with open(self.keys_file, "r", encoding="utf-8") as f:
+                content = f.read()
+        # Последний кусок без перевода строки - недописанный ключ
+        keys = content.split("\n")[:-1]
+        partial_key = not content.endswith("\n") and bool(content)
+
+        row_bytes = self.dim * 4
+        vectors_size = os.path.getsize(self.vectors_file) if os.path.exists(self.vectors_file) else 0
+        count = min(len(keys), vectors_size // row_bytes)
+
+        if vectors_size != count * row_bytes:
+            with open(self.vectors_file, "r+b") as f:
+                f.truncate(count * row_bytes)
+        if len(keys) != count or partial_key:
+            with open(self.keys_file, "w", encoding="utf-8") as f:
+                f.write("".join(f"{key}\n" for key in keys[:count]))
+
+        # Повторный ключ (его закодировали два процесса) указывает на первую строку
+        for row in range(self._count, count):
+            self._rows.setdefault(keys[row], row)
+        if count != self._count or self._vectors is None:
+            self._count = count
+            self._vectors = np.memmap(self.vectors_file, dtype="float32", mode="r",
+                                      shape=(count, self.dim)) if count else None
+
+    def _append(self, keys, vectors):
+        """
+        Дописывание новых векторов в конец файлов под межпроцессной блокировкой.
+        Ключи, которые тем временем записал другой процесс, повторно не пишутся
+        """
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        with self._file_lock():
+            self._sync_from_disk()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.meta_file, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dim": self.dim}, f)
+
+            new = [position for position, key in enumerate(keys) if key not in self._rows]
+            if not new:
+                return
+            keys = [keys[position] for position in new]
+
+            # Сначала векторы, потом ключи: при сбое лишние векторы отбросятся при следующей синхронизации
+            with open(self.vectors_file, "ab") as f:
+                f.write(vectors[new].tobytes())
+            with open(self.keys_file, "a", encoding="utf-8") as f:
+                f.write("".join(f"{key}\n" for key in keys))
+
+            # Начальная строка - по файлам на диске после синхронизации, а не по памяти процесса
+            start = self._count
+            for offset, key in enumerate(keys):
+                self._rows[key] = start + offset
+            self._count = start + len(keys)
+            self._vectors = np.memmap(self.vectors_file, dtype="float32", mode="r", shape=(self._count, self.dim))
+
+    def get(self, keys):
+        """Векторы по ключам (все ключи должны присутствовать в хранилище)"""
+        with self._lock:
+            rows = [self._rows[key] for key in keys]
+            if not rows:
+                return np.empty((0, self.dim or 0), dtype="float32")
+            return np.asarray(self._vectors[rows], dtype="float32")
+
+    def encode(self, texts, encoder, batch_size: int = 64):
+        """
+        Возвращает матрицу эмбеддингов для texts.
+        Кодирует батчами только те тексты, которых ещё нет в хранилище.
+        :param encoder: функция (list[str], batch_size) -> np.ndarray
+        """
+        keys = [self.text_key(text) for text in texts]
+
+        with self._lock:
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self._rows and key not in missing:
+                    missing[key] = text
+
+            if missing:
+                logger.info(f"Кодирование {len(missing)} новых текстов (в кеше {len(self._rows)})")
+                vectors = encoder(list(missing.values()), batch_size)
+                self._append(list(missing.keys()), vectors)
+
+            return self.get(keys)
+
+
+def fingerprint(keys) -> str:
+    """Отпечаток набора ключей для проверки актуальности снимка индекса"""
+    digest = hashlib.sha1()
+    for key in keys:
+        digest.update(key.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def save_index_snapshot(index, path: str, snapshot_fingerprint: str, version: int = None):
+    """
+    Атомарное сохранение FAISS индекса вместе с отпечатком данных.
+    version - версия источника данных (журнала), по которой снимок тоже проверяется при загрузке
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    meta_path = f"{path}.json"
+
+    # Сначала убираем метаданные: снимок без отпечатка считается устаревшим
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    # Временные файлы у каждого процесса свои - снимок могут сохранять несколько воркеров
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+    meta_tmp = f"{meta_path}.{os.getpid()}.tmp"
+    with open(meta_tmp, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": snapshot_fingerprint, "ntotal": int(index.ntotal), "version": version}, f)
+    os.replace(meta_tmp, meta_path)
+
+
+def load_index_snapshot(path: str, snapshot_fingerprint: str, version: int = None):
+    """
+    Загрузка снимка индекса через mmap, если совпадают отпечаток и версия данных.
+    Возвращает None, если снимка нет или он устарел.
+    """
+    meta_path = f"{path}.json"
+    if not (os.path.exists(path) and os.path.exists(meta_path)):
+        return None
+
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("fingerprint") != snapshot_fingerprint or meta.get("version") != version:
+            return None
+        index = faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC)
+        # Индекс и метаданные пишутся разными файлами - другой процесс мог заменить индекс между ними
+        if index.ntotal != meta.get("ntotal"):
+            return None
+        return index
+    except Exception as e:
+        logger.error(f"Не удалось загрузить снимок индекса {path}: {e}")
+        return None
+
+
+def _slugify(name: str) -> str:
+    return "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in name)
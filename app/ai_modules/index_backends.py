@@ -0,0 +1,123 @@
+import os
+import logging
+import numpy as np
+import faiss
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_TYPE = "flat"
+
+# Строки index_factory для поддерживаемых типов индекса
+INDEX_SPECS = {
+    "flat": "Flat",                 # точный поиск, 4 * dim байт на вектор
+    "sq8": "SQ8",                   # скалярное квантование в int8, памяти в 4 раза меньше
+    "ivf": "IVF{nlist},Flat",       # поиск только по nprobe ближайшим кластерам
+    "ivfpq": "IVF{nlist},PQ{m}",    # кластеры + product quantization, ~dim / 8 байт на вектор
+    "hnsw": "HNSW32,Flat",          # граф HNSW: быстрый поиск, но без удаления векторов
+}
+
+# Минимальный объём данных для обучения; на меньших наборах используется Flat
+MIN_TRAIN_SIZE = {
+    "sq8": 1000,     # диапазоны квантования по каждому измерению; пустой SQ8 не обучен и не принимает векторы
+    "ivf": 1000,
+    "ivfpq": 10000,  # 256 центроидов на каждый подквантователь PQ
+}
+
+# Обучение на случайной подвыборке, чтобы сборка больших индексов не растягивалась
+MAX_TRAIN_SIZE = 50000
+
+
+def resolve_index_type(index_type: str = None) -> str:
+    """Тип индекса из аргумента или переменной AI_INDEX_TYPE"""
+    index_type = (index_type or os.getenv("AI_INDEX_TYPE", DEFAULT_INDEX_TYPE)).strip().lower()
+    if index_type not in INDEX_SPECS:
+        logger.warning(f"Неизвестный тип индекса {index_type}, используется {DEFAULT_INDEX_TYPE}")
+        return DEFAULT_INDEX_TYPE
+    return index_type
+
+
+def create_index(index_type: str, dim: int, n_vectors: int = 0):
+    """
+    Пустой индекс с адресацией по внешним id (IndexIDMap2).
+    Если данных для обучения мало, возвращается точный Flat индекс
+    """
+    if n_vectors < MIN_TRAIN_SIZE.get(index_type, 0):
+        index_type = DEFAULT_INDEX_TYPE
+
+    # ~39 точек на центроид - минимум, при котором k-means не ругается
+    nlist = max(1, min(int(4 * np.sqrt(n_vectors)), n_vectors // 39))
+    spec = INDEX_SPECS[index_type].format(nlist=nlist, m=_pq_subquantizers(dim))
+    return faiss.index_factory(dim, f"IDMap2,{spec}")
+
+
+def build_index(index_type: str, dim: int, vectors: np.ndarray, ids: np.ndarray):
+    """Создание, обучение и заполнение индекса"""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    index = create_index(index_type, dim, len(vectors))
+
+    if not index.is_trained:
+        train = vectors
+        if len(vectors) > MAX_TRAIN_SIZE:
+            sample = np.random.default_rng(0).choice(len(vectors), MAX_TRAIN_SIZE, replace=False)
+            train = vectors[sample]
+        index.train(train)
+
+    if len(vectors):
+        index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    return index
+
+
+def index_kind(index) -> str:
+    """Фактический тип индекса (для загруженных снимков и индексов с откатом на Flat)"""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        return "sq8"
+    return "flat"
+
+
+def is_exhaustive(index) -> bool:
+    """
+    Flat и SQ8 сравнивают запрос со всеми векторами, поэтому поиск с IDSelector
+    всегда находит top_k среди кандидатов. IVF видит только кандидатов из nprobe
+    кластеров, HNSW - только достижимых по графу: им кандидаты нужно ранжировать отдельно
+    """
+    return index_kind(index) in ("flat", "sq8")
+
+
+def supports_remove(index) -> bool:
+    """HNSW не поддерживает remove_ids - такой индекс перестраивается"""
+    return index_kind(index) != "hnsw"
+
+
+def search_params(index, selector=None):
+    """
+    Параметры поиска под тип индекса: nprobe для IVF, efSearch для HNSW.
+    Значения задаются переменными AI_INDEX_NPROBE и AI_HNSW_EF_SEARCH
+    """
+    kind = index_kind(index)
+    if kind in ("ivf", "ivfpq"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=int(os.getenv("AI_INDEX_NPROBE", "16")))
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=int(os.getenv("AI_HNSW_EF_SEARCH", "64")))
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+def index_size_bytes(index) -> int:
+    """Размер сериализованного индекса - оценка занимаемой памяти"""
+    return int(faiss.serialize_index(index).size)
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Число подквантователей PQ: ~8 измерений на подвектор, dim должен делиться нацело"""
+    for m in range(max(1, dim // 8), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
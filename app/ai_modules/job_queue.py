@@ -0,0 +1,168 @@
+import time
+import uuid
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """
+    Фоновая задача AI. Ответ накапливается в text по мере генерации,
+    ожидающие (SSE, опрос статуса) будятся через условие
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"  # queued -> running -> done | error
+        self.text = ""
+        self.html = None
+        self.usage = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+    def _update(self, **fields):
+        with self._cond:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self._cond.notify_all()
+
+    def start(self):
+        self._update(status="running", started_at=time.time())
+
+    def append(self, delta: str):
+        with self._cond:
+            self.text += delta
+            self._cond.notify_all()
+
+    def finish(self, html: str = None, usage: dict = None):
+        self._update(status="done", html=html, usage=usage, finished_at=time.time())
+
+    def fail(self, error: str):
+        self._update(status="error", error=error, finished_at=time.time())
+
+    def wait(self, seen_length: int, seen_status: str, timeout: float = 15):
+        """
+        Ждёт новый текст или смену статуса.
+        Возвращает (text, status) - снимок на момент пробуждения
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: len(self.text) > seen_length or self.status != seen_status,
+                timeout=timeout
+            )
+            return self.text, self.status
+
+    def to_dict(self, position: int = None) -> dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "text": self.text,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if position is not None:
+            data["position"] = position
+        if self.status == "done":
+            data["response"] = self.html
+            data["usage"] = self.usage
+        if self.status == "error":
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    """
+    Очередь AI-задач с фиксированным пулом воркеров.
+
+    Запросы к LLM выполняются не в потоках веб-сервера, а в пуле из
+    max_workers потоков; не более max_pending задач ждут своей очереди.
+    Каждая задача работает в своём app context - со своей сессией БД.
+    Завершённые задачи хранятся ttl секунд для опроса результата.
+    """
+
+    def __init__(self, app, max_workers: int = 2, max_pending: int = 20, ttl: float = 600):
+        self.app = app
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+        self._queued = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-job")
+
+    def submit(self, func: Callable, *args) -> Optional[Job]:
+        """
+        Ставит func(job, *args) в очередь.
+        Возвращает None, если очередь переполнена
+        """
+        with self._lock:
+            self._prune()
+            if len(self._queued) >= self.max_pending:
+                return None
+            job = Job()
+            self._jobs[job.id] = job
+            self._queued.append(job.id)
+
+        self._executor.submit(self._run, job, func, args)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> Optional[int]:
+        """Место задачи в очереди (1 - следующая), None - уже выполняется или завершена"""
+        with self._lock:
+            if job.id in self._queued:
+                return self._queued.index(job.id) + 1
+        return None
+
+    def _run(self, job: Job, func: Callable, args: tuple):
+        with self._lock:
+            self._queued.remove(job.id)
+        job.start()
+
+        try:
+            with self.app.app_context():
+                try:
+                    func(job, *args)
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            logger.error(f"[AI] Ошибка задачи {job.id}: {e}", exc_info=True)
+            job.fail(f"Системная ошибка: {str(e)}")
+        else:
+            if not job.finished:
+                job.finish(html=job.html, usage=job.usage)
+
+    def _prune(self):
+        """Удаление завершённых задач старше ttl"""
+        expire_before = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < expire_before]:
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.status == "running")
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "queued": len(self._queued),
+                "running": running,
+                "jobs": len(self._jobs),
+            }
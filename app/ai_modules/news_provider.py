@@ -1,24 +1,168 @@
 import os
 import json
 import time
+import atexit
+import heapq
 import random
 import threading
 import requests
 import logging
 
+from ..ai_modules.calendar_store import CalendarStore, get_calendar_store
+
 logger = logging.getLogger(__name__)
 
 
+class NewsScheduler:
+    """
+    Общий на процесс планировщик обновления новостей.
+
+    Все периодические задачи выполняются в одном daemon-потоке, поэтому
+    пересоздание провайдеров не плодит таймеры, а процесс завершается
+    без ожидания. Задача - функция, возвращающая задержку до следующего
+    запуска в секундах (None - больше не запускать). Задача с тем же
+    именем заменяет предыдущую.
+    """
+
+    def __init__(self):
+        self._queue = []      # (время запуска, порядковый номер, имя)
+        self._tasks = {}      # имя -> (номер, функция)
+        self._counter = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def schedule(self, name: str, func, delay: float = 0):
+        with self._cond:
+            self._counter += 1
+            self._tasks[name] = (self._counter, func)
+            heapq.heappush(self._queue, (time.monotonic() + delay, self._counter, name))
+            self._cond.notify()
+        self.start()
+
+    def cancel(self, name: str):
+        with self._cond:
+            self._tasks.pop(name, None)
+
+    def start(self):
+        with self._cond:
+            if self._stopped or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name="news-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """Остановка потока: текущая задача дорабатывает, новые не запускаются"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _next_due(self):
+        """Ждёт ближайшую задачу. Возвращает (имя, функция) или None при остановке"""
+        with self._cond:
+            while not self._stopped:
+                if not self._queue:
+                    self._cond.wait()
+                    continue
+
+                run_at, number, name = self._queue[0]
+                task = self._tasks.get(name)
+                if task is None or task[0] != number:
+                    # Отменённая или заменённая задача
+                    heapq.heappop(self._queue)
+                    continue
+
+                delay = run_at - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+
+                heapq.heappop(self._queue)
+                return name, task[1]
+        return None
+
+    def _run(self):
+        while True:
+            due = self._next_due()
+            if due is None:
+                return
+            name, func = due
+
+            try:
+                next_delay = func()
+            except Exception as e:
+                logger.error(f"Ошибка задачи планировщика {name}: {e}")
+                next_delay = 300
+
+            with self._cond:
+                # Повторно ставим задачу, только если её не отменили и не заменили во время выполнения
+                current = self._tasks.get(name)
+                if next_delay is not None and current is not None and current[1] is func:
+                    heapq.heappush(self._queue, (time.monotonic() + next_delay, current[0], name))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def news_key(item: dict) -> tuple:
+    """Стабильный ключ события календаря: не меняется, когда выходит фактическое значение или правится прогноз"""
+    return item.get("date"), item.get("title"), item.get("country")
+
+
+def _important_news(item: dict) -> dict:
+    """Событие в формате кеша новостей (пустые поля заменены подписями)"""
+    return {
+        "date": item.get("date"),
+        "title": item.get("title"),
+        "forecast": item.get("forecast") or "нет данных",
+        "previous": item.get("previous") or "нет данных",
+        "actual": item.get("actual") or "ещё не вышло",
+        "impact": item.get("impact"),
+        "country": item.get("country"),
+    }
+
+
+def get_news_scheduler() -> NewsScheduler:
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = NewsScheduler()
+            atexit.register(_scheduler.stop)
+        return _scheduler
+
+
+def get_news_provider() -> "ForexNewsProvider":
+    """Единый провайдер на процесс; первое обновление идёт в фоне и не блокирует вызывающего"""
+    global _provider
+
+    with _provider_lock:
+        if _provider is None:
+            _provider = ForexNewsProvider()
+            _provider.start()
+        return _provider
+
+
 class ForexNewsProvider:
     """Класс для загрузки и кеширования экономических новостей ForexFactory"""
 
-    def __init__(self, cache_dir="cache", static_cache_file="forexfactory_static.json"):
+    UPDATE_INTERVAL = 3600     # обновление раз в час
+    UPDATE_JITTER = 300        # ± 5 минут, чтобы процессы не ходили за новостями одновременно
+    RETRY_BASE_DELAY = 30      # первая повторная попытка после ошибки
+    RETRY_MAX_DELAY = 3600
+
+    def __init__(self, cache_dir="cache", calendar: CalendarStore = None):
         # Создаём папку cache, если её нет
         self.cache_dir = cache_dir
         os.makedirs(self.cache_dir, exist_ok=True)
 
-        self.static_cache_file = os.path.join(self.cache_dir, static_cache_file)
-        self.static_cache = {}
+        # История календаря (все страны и важности) копится в SQLite между обновлениями
+        self.calendar = calendar or get_calendar_store()
         self.news_cache = {"timestamp": 0, "news": []}
         self.url = "https://nfs.faireconomy.media/ff_calendar_thisweek.json"
         self.headers = {
@@ -29,67 +173,103 @@ class ForexNewsProvider:
             )
         }
 
-        # Загрузка и сохранение статичного кеша при старте
-        self._load_static_cache()
-        self._save_static_cache()
+        # Валидаторы для условного GET и счётчик ошибок подряд для backoff
+        self._etag = None
+        self._last_modified = None
+        self._failures = 0
+        self._listeners = []
 
-        # Запуск периодического обновления новостей
-        self._start_periodic_update()
+        # До первого обновления отдаём новости текущей недели из календаря; сеть в конструкторе не используется
+        self._load_cached_news()
 
-    def _load_static_cache(self):
-        """Загрузка статичного кеша с диска при старте"""
-        if os.path.exists(self.static_cache_file):
-            try:
-                with open(self.static_cache_file, "r", encoding="utf-8") as f:
-                    self.static_cache = json.load(f)
-                logger.info("Статичный кеш загружен с диска.")
-            except Exception as e:
-                logger.error(f"Не удалось загрузить статичный кеш: {e}")
-                self.static_cache = {}
+    def start(self, scheduler: NewsScheduler = None):
+        """Планирует немедленное и затем периодическое обновление в общем планировщике"""
+        (scheduler or get_news_scheduler()).schedule(f"news:{self.url}", self._scheduled_update)
+
+    def stop(self, scheduler: NewsScheduler = None):
+        (scheduler or get_news_scheduler()).cancel(f"news:{self.url}")
+
+    def subscribe(self, listener):
+        """listener(news) вызывается в потоке планировщика после каждого изменения новостей"""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _load_cached_news(self):
+        """Важные события ±7 дней от текущего момента из календаря (переживают перезапуск)"""
+        self._import_legacy_static_cache()
+        try:
+            now = int(time.time())
+            events = self.calendar.events_between(now - 7 * 86400, now + 7 * 86400, country="USD",
+                                                  impacts=("High", "Medium"))
+        except Exception as e:
+            logger.error(f"Не удалось прочитать календарь: {e}")
+            return
+        if events:
+            self.news_cache = {"timestamp": 0, "news": [_important_news(event) for event in events]}
+            logger.info(f"Из календаря загружено {len(events)} событий.")
 
-    def _save_static_cache(self):
-        """Сохранение статичного кеша на диск"""
+    def _import_legacy_static_cache(self):
+        """Одноразовый перенос старого forexfactory_static.json в календарь"""
+        legacy_file = os.path.join(self.cache_dir, "forexfactory_static.json")
+        if not os.path.exists(legacy_file):
+            return
         try:
-            with open(self.static_cache_file, "w", encoding="utf-8") as f:
-                json.dump(self.static_cache, f, ensure_ascii=False, indent=2)
-            logger.info(f"Статичный кеш сохранён на диск: {self.static_cache_file}")
+            with open(legacy_file, "r", encoding="utf-8") as f:
+                self.calendar.upsert(json.load(f).get("events", []))
+            os.remove(legacy_file)
+            logger.info("Статичный кеш перенесён в календарь.")
         except Exception as e:
-            logger.error(f"Ошибка при сохранении статичного кеша: {e}")
+            logger.error(f"Не удалось перенести статичный кеш: {e}")
+
+    def _scheduled_update(self) -> float:
+        """Одно обновление; возвращает задержку до следующего с учётом jitter и backoff"""
+        if self._update_news_cache():
+            self._failures = 0
+            return self.UPDATE_INTERVAL + random.uniform(-self.UPDATE_JITTER, self.UPDATE_JITTER)
+
+        # Экспоненциальный backoff с "полным" jitter: случайная задержка до текущего предела
+        self._failures += 1
+        ceiling = min(self.RETRY_MAX_DELAY, self.RETRY_BASE_DELAY * 2 ** (self._failures - 1))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def _update_news_cache(self) -> bool:
+        """Загрузка новостей и обновление кеша. Возвращает False при ошибке"""
+        headers = dict(self.headers)
+        # Валидаторы отправляем только если есть что переиспользовать
+        if self.news_cache["news"]:
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
 
-    def _update_news_cache(self):
-        """Загрузка новостей и обновление кеша"""
         try:
-            resp = requests.get(self.url, headers=self.headers, timeout=10)
+            resp = requests.get(self.url, headers=headers, timeout=10)
+            now = int(time.time())
+
+            if resp.status_code == 304:
+                self.news_cache["timestamp"] = now
+                logger.info("Новости ForexFactory не изменились (304).")
+                return True
+
             resp.raise_for_status()
             data = resp.json()
-            now = int(time.time())
+            self._etag = resp.headers.get("ETag")
+            self._last_modified = resp.headers.get("Last-Modified")
 
-            # Обновляем статичный кеш раз в сутки
-            if not self.static_cache or (now - self.static_cache.get("timestamp", 0) > 86400):
-                self.static_cache = {
-                    "timestamp": now,
-                    "events": [
-                        {
-                            "date": item.get("date"),
-                            "title": item.get("title"),
-                            "impact": item.get("impact"),
-                            "country": item.get("country"),
-                        }
-                        for item in data if item.get("country") == "USD"
-                    ]
-                }
-                self._save_static_cache()
+            # В календарь пишется вся неделя: новые события добавляются, у известных обновляется факт
+            try:
+                changed = self.calendar.upsert(data)
+                if changed:
+                    logger.info(f"Календарь обновлён ({changed} событий).")
+            except Exception as e:
+                logger.error(f"Ошибка записи календаря: {e}")
 
             # Динамический кеш: только важные события
             important_news = [
-                {
-                    "date": item.get("date"),
-                    "title": item.get("title"),
-                    "forecast": item.get("forecast") or "нет данных",
-                    "previous": item.get("previous") or "нет данных",
-                    "actual": item.get("actual") or "ещё не вышло",
-                    "impact": item.get("impact"),
-                }
+                _important_news(item)
                 for item in data if item.get("impact") in ["High", "Medium"] and item.get("country") == "USD"
             ]
             self.news_cache = {"timestamp": now, "news": important_news}
@@ -97,25 +277,24 @@ class ForexNewsProvider:
 
         except Exception as e:
             logger.error(f"Ошибка при получении данных с ForexFactory: {e}")
-            if not self.news_cache["news"]:
-                self.news_cache["news"] = [{"error": "Не удалось получить новости"}]
+            return False
 
-    def _start_periodic_update(self):
-        """Запуск периодического обновления новостей каждый час ± 5 минут"""
+        self._notify(important_news)
+        return True
 
-        def updater():
-            self._update_news_cache()
-            delay = 3600 + random.randint(-300, 300)
-            threading.Timer(delay, updater).start()
-
-        updater()
+    def _notify(self, news):
+        for listener in list(self._listeners):
+            try:
+                listener(news)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика обновления новостей: {e}")
 
     def get_latest_news(self, top_k: int = None):
         """
-        Возвращает актуальные новости
+        Возвращает актуальные новости (без обращения к сети)
         :param top_k: если указано, вернёт не более top_k новостей
         """
         news = self.news_cache.get("news", [])
         if top_k:
             return news[:top_k]
-        return news
\ No newline at end of file
+        return news
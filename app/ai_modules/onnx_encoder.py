@@ -0,0 +1,146 @@
+import os
+import logging
+import numpy as np
+
+from ..ai_modules.embedding_store import _slugify
+
+logger = logging.getLogger(__name__)
+
+ONNX_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+
+class OnnxSentenceEncoder:
+    """
+    Кодировщик sentence-transformers модели через ONNX Runtime.
+
+    Повторяет конвейер all-MiniLM-L6-v2 (токенизация, трансформер,
+    mean pooling, L2-нормализация), но в рабочем процессе не нужен torch.
+    Модель экспортируется в ONNX один раз (для экспорта нужны torch и
+    transformers) и при quantize=True динамически квантуется в int8.
+    Интерфейс encode() совместим с SentenceTransformer.encode.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = "cache/onnx", quantize: bool = True,
+                 max_seq_length: int = 256, threads: int = None):
+        # onnxruntime и tokenizers - необязательные зависимости, нужны только для этого бэкенда
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                f"Для ONNX бэкенда эмбеддингов нужны onnxruntime и tokenizers "
+                f"(pip install onnxruntime tokenizers): {e}"
+            ) from e
+
+        self.model_name = model_name
+        self.model_dir = os.path.join(cache_dir, _slugify(model_name))
+        model_path = ensure_onnx_model(model_name, self.model_dir, quantize=quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.dim = self.session.get_outputs()[0].shape[-1]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True,
+               show_progress_bar: bool = False, normalize_embeddings: bool = True) -> np.ndarray:
+        """
+        Эмбеддинги текстов (float32). Для одной строки возвращается вектор, для списка - матрица.
+        convert_to_numpy и show_progress_bar принимаются для совместимости с SentenceTransformer
+        """
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            encodings = self.tokenizer.encode_batch(list(sentences[start:start + batch_size]))
+            attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype="int64")
+            feed = {
+                "input_ids": np.array([encoding.ids for encoding in encodings], dtype="int64"),
+                "attention_mask": attention_mask,
+                "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype="int64"),
+            }
+            feed = {name: value for name, value in feed.items() if name in self.input_names}
+
+            token_embeddings = self.session.run(None, feed)[0]
+
+            # Mean pooling по реальным токенам, как в модуле Pooling sentence-transformers
+            mask = attention_mask[..., None].astype("float32")
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype("float32"))
+
+        embeddings = np.vstack(batches) if batches else np.empty((0, self.dim), dtype="float32")
+        return embeddings[0] if single else embeddings
+
+
+def ensure_onnx_model(model_name: str, model_dir: str, quantize: bool = True) -> str:
+    """Путь к ONNX модели; при первом запуске модель экспортируется и квантуется"""
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model.int8.onnx")
+
+    if not (os.path.exists(fp32_path) and os.path.exists(os.path.join(model_dir, "tokenizer.json"))):
+        export_onnx(model_name, model_dir)
+
+    if not quantize:
+        return fp32_path
+
+    if not os.path.exists(int8_path):
+        try:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+        except ImportError as e:
+            raise ImportError(f"Для квантования в int8 нужны onnx и onnxruntime (pip install onnx onnxruntime): {e}") from e
+
+        logger.info(f"Квантование {fp32_path} в int8...")
+        tmp_path = f"{int8_path}.tmp"
+        # Веса линейных слоёв в int8, активации квантуются на лету
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+
+    return int8_path
+
+
+def export_onnx(model_name: str, model_dir: str):
+    """Одноразовый экспорт трансформера и токенизатора из Hugging Face в ONNX (нужны torch и transformers)"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    hub_name = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    logger.info(f"Экспорт {hub_name} в ONNX...")
+
+    tokenizer = AutoTokenizer.from_pretrained(hub_name)
+    model = AutoModel.from_pretrained(hub_name)
+    model.config.return_dict = False
+    model.eval()
+
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer.save_pretrained(model_dir)
+
+    sample = tokenizer(["пример текста", "sample text"], padding=True, return_tensors="pt")
+    input_names = [name for name in ONNX_INPUTS if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    model_path = os.path.join(model_dir, "model.onnx")
+    tmp_path = f"{model_path}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            tmp_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+    os.replace(tmp_path, model_path)
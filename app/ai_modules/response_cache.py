@@ -0,0 +1,112 @@
+import hashlib
+import threading
+from typing import Callable
+
+from ..ai_modules.lru_cache import TTLCache
+
+
+class _Flight:
+    """Выполняющийся запрос к LLM, результат которого ждут одинаковые запросы"""
+
+    def __init__(self, generation: int):
+        self.done = threading.Event()
+        self.generation = generation
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    Кеш ответов LLM по хешу итогового промпта и модели.
+
+    Одинаковые промпты, пришедшие одновременно (например, двойной клик),
+    объединяются в один вызов API: первый запрос выполняет вызов,
+    остальные ждут его результат.
+
+    clear() увеличивает поколение кеша: ответ запроса, начатого до сброса,
+    возвращается ожидающим, но в кеш уже не попадает.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 900):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        return self._cache.get(key)
+
+    def begin(self, key: str):
+        """
+        Регистрирует запрос. Возвращает (flight, is_leader):
+        лидер должен вызвать finish(), остальные - дождаться wait()
+        """
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = _Flight(self._generation)
+            self._inflight[key] = flight
+            return flight, True
+
+    def finish(self, key: str, flight: _Flight, value=None, error: Exception = None):
+        """
+        Сохраняет результат лидера и будит ожидающих.
+        Ошибки, пустые ответы и ответы, начатые до clear(), не кешируются
+        """
+        flight.value = value
+        flight.error = error
+        with self._lock:
+            if error is None and value and flight.generation == self._generation:
+                self._cache.put(key, value)
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        flight.done.set()
+
+    @staticmethod
+    def wait(flight: _Flight, timeout: float = None):
+        if not flight.done.wait(timeout):
+            raise TimeoutError("Превышено время ожидания ответа AI")
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def get_or_compute(self, key: str, compute: Callable[[], str]) -> str:
+        """Ответ из кеша, из уже выполняющегося запроса или новый вызов compute()"""
+        value = self.get(key)
+        if value:
+            return value
+
+        flight, is_leader = self.begin(key)
+        if not is_leader:
+            return self.wait(flight)
+
+        try:
+            value = compute()
+        except Exception as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, value=value)
+        return value
+
+    def clear(self):
+        """
+        Сброс закешированных ответов. Выполняющиеся запросы доработают для своих ожидающих,
+        но новые одинаковые запросы к ним уже не присоединятся, а их результат не сохранится
+        """
+        with self._lock:
+            self._generation += 1
+            self._inflight.clear()
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        stats = self._cache.stats()
+        stats["inflight"] = len(self._inflight)
+        stats["coalesced"] = self.coalesced
+        return stats
@@ -0,0 +1,261 @@
+import threading
+import numpy as np
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+from ..ai_modules.context_packer import table_cell
+
+
+class _Vocabulary:
+    """Интернирование строковых значений в компактные коды (-1 = пусто)"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def code(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: Optional[str]) -> Optional[int]:
+        """Код существующего значения без добавления нового"""
+        return self._codes.get(value)
+
+    def match(self, value: str) -> Optional[str]:
+        """Существующее значение без учёта регистра (EURUSD == eurusd)"""
+        value = value.lower()
+        for known in self.values:
+            if known.lower() == value:
+                return known
+        return None
+
+    def value(self, code: int) -> Optional[str]:
+        return self.values[code] if code >= 0 else None
+
+
+class TradeColumns:
+    """
+    Колоночное представление журнала для AI-поиска.
+
+    Строки отсортированы по (дата, id), поэтому выборка по дате и
+    "последние N" - это бинарный поиск. Индекс по символу строится
+    лениво после изменений. Текст для промпта рендерится только для
+    выбранных строк.
+    """
+
+    _CATEGORICAL = ("symbol", "session", "result_type", "position", "direction")
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype="int64")
+        self.date_ord = np.empty(0, dtype="int32")
+        self.rr = np.empty(0, dtype="float64")
+        self.risk = np.empty(0, dtype="float64")
+        self.profit = np.empty(0, dtype="float64")
+        self.codes = {name: np.empty(0, dtype="int16") for name in self._CATEGORICAL}
+        self.vocab = {name: _Vocabulary() for name in self._CATEGORICAL}
+        self.notes = np.empty(0, dtype=object)
+
+        self._id_to_row = None
+        self._symbol_index = None
+        # Растёт при каждом изменении; по нему кеши поверх журнала понимают, что устарели
+        self.version = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ----- Построение и изменение -----
+
+    def _columns_for(self, trades) -> dict:
+        trades = sorted(trades, key=lambda t: (t.date.toordinal(), t.id))
+        return {
+            "ids": np.fromiter((t.id for t in trades), dtype="int64", count=len(trades)),
+            "date_ord": np.fromiter((t.date.toordinal() for t in trades), dtype="int32", count=len(trades)),
+            "rr": np.array([_to_float(t.rr) for t in trades], dtype="float64"),
+            "risk": np.array([_to_float(t.risk) for t in trades], dtype="float64"),
+            "profit": np.array([_to_float(t.profit) for t in trades], dtype="float64"),
+            "codes": {
+                name: np.array([self.vocab[name].code(getattr(t, name)) for t in trades], dtype="int16")
+                for name in self._CATEGORICAL
+            },
+            "notes": np.array([t.notes for t in trades], dtype=object),
+        }
+
+    def upsert(self, trades: Iterable):
+        """Добавление или замена строк по Trade.id"""
+        trades = list(trades)
+        if not trades:
+            return
+
+        with self._lock:
+            self.remove(t.id for t in trades)
+            new = self._columns_for(trades)
+
+            # Позиции вставки сохраняют сортировку по (дата, id)
+            keys = self.date_ord.astype("int64") * (1 << 32) + self.ids
+            new_keys = new["date_ord"].astype("int64") * (1 << 32) + new["ids"]
+            positions = np.searchsorted(keys, new_keys)
+
+            self.ids = np.insert(self.ids, positions, new["ids"])
+            self.date_ord = np.insert(self.date_ord, positions, new["date_ord"])
+            self.rr = np.insert(self.rr, positions, new["rr"])
+            self.risk = np.insert(self.risk, positions, new["risk"])
+            self.profit = np.insert(self.profit, positions, new["profit"])
+            self.notes = np.insert(self.notes, positions, new["notes"])
+            for name in self._CATEGORICAL:
+                self.codes[name] = np.insert(self.codes[name], positions, new["codes"][name])
+
+            self._invalidate()
+
+    def remove(self, trade_ids: Iterable[int]):
+        """Удаление строк по Trade.id"""
+        with self._lock:
+            rows = self.rows_for_ids(trade_ids)
+            if not len(rows):
+                return
+
+            keep = np.ones(len(self.ids), dtype=bool)
+            keep[rows] = False
+
+            self.ids = self.ids[keep]
+            self.date_ord = self.date_ord[keep]
+            self.rr = self.rr[keep]
+            self.risk = self.risk[keep]
+            self.profit = self.profit[keep]
+            self.notes = self.notes[keep]
+            for name in self._CATEGORICAL:
+                self.codes[name] = self.codes[name][keep]
+
+            self._invalidate()
+
+    def _invalidate(self):
+        self._id_to_row = None
+        self._symbol_index = None
+        self.version += 1
+
+    # ----- Индексы -----
+
+    def rows_for_ids(self, trade_ids: Iterable[int]) -> np.ndarray:
+        """Строки для списка Trade.id в том же порядке (неизвестные id пропускаются)"""
+        with self._lock:
+            if self._id_to_row is None:
+                self._id_to_row = {trade_id: row for row, trade_id in enumerate(self.ids.tolist())}
+            rows = [self._id_to_row.get(int(trade_id)) for trade_id in trade_ids]
+            return np.array([row for row in rows if row is not None], dtype="int64")
+
+    def rows_in_range(self, date_from: Optional[date] = None, date_to: Optional[date] = None) -> np.ndarray:
+        """Строки в диапазоне дат включительно - O(log N)"""
+        start = np.searchsorted(self.date_ord, date_from.toordinal(), side="left") if date_from else 0
+        end = np.searchsorted(self.date_ord, date_to.toordinal(), side="right") if date_to else len(self.date_ord)
+        return np.arange(start, end, dtype="int64")
+
+    def latest(self, n: int) -> np.ndarray:
+        """Последние n строк, от новых к старым"""
+        n = min(n, len(self.ids))
+        return np.arange(len(self.ids) - 1, len(self.ids) - 1 - n, -1, dtype="int64")
+
+    def rows_for_symbol(self, symbol: str) -> np.ndarray:
+        """Строки символа, отсортированные по дате"""
+        code = self.vocab["symbol"].lookup(symbol)
+        if code is None:
+            return np.empty(0, dtype="int64")
+
+        with self._lock:
+            if self._symbol_index is None:
+                # Стабильная сортировка сохраняет порядок дат внутри каждого символа
+                order = np.argsort(self.codes["symbol"], kind="stable")
+                sorted_codes = self.codes["symbol"][order]
+                self._symbol_index = (order, sorted_codes)
+            order, sorted_codes = self._symbol_index
+
+        start = np.searchsorted(sorted_codes, code, side="left")
+        end = np.searchsorted(sorted_codes, code, side="right")
+        return order[start:end]
+
+    def select(self, symbol: Optional[str] = None, session: Optional[str] = None,
+               position: Optional[str] = None, result_type: Optional[str] = None,
+               date_from: Optional[date] = None, date_to: Optional[date] = None) -> np.ndarray:
+        """
+        Строки, подходящие под все условия, в порядке дат.
+        Символ и дата сужают выборку через индексы, остальное - маска по кодам
+        """
+        with self._lock:
+            if symbol is not None:
+                rows = self.rows_for_symbol(symbol)
+                if date_from or date_to:
+                    dates = self.date_ord[rows]
+                    start = np.searchsorted(dates, date_from.toordinal(), side="left") if date_from else 0
+                    end = np.searchsorted(dates, date_to.toordinal(), side="right") if date_to else len(rows)
+                    rows = rows[start:end]
+            else:
+                rows = self.rows_in_range(date_from, date_to)
+
+            for name, value in (("session", session), ("position", position), ("result_type", result_type)):
+                if value is None:
+                    continue
+                code = self.vocab[name].lookup(value)
+                if code is None:
+                    return np.empty(0, dtype="int64")
+                rows = rows[self.codes[name][rows] == code]
+
+            return rows
+
+    # ----- Доступ к значениям -----
+
+    def value(self, name: str, row: int) -> Optional[str]:
+        return self.vocab[name].value(int(self.codes[name][row]))
+
+    def render(self, rows: Iterable[int]) -> List[str]:
+        """Текстовые описания сделок только для выбранных строк"""
+        return [self._render_row(int(row)) for row in rows]
+
+    def _render_row(self, row: int) -> str:
+        return (
+            f"СДЕЛКА: Дата={date.fromordinal(int(self.date_ord[row])).strftime('%Y-%m-%d')}, "
+            f"Символ={self.value('symbol', row)}, Направление={self.value('direction', row)}, "
+            f"R:R={_from_float(self.rr[row])}, Профит=${_from_float(self.profit[row])}, "
+            f"Результат={self.value('result_type', row)}, "
+            f"Сессия={self.value('session', row)}, Позиция={self.value('position', row)}, "
+            f"Комментарий={self.notes[row] or 'нет комментария'}"
+        )
+
+
+    # Компактная табличная форма для промпта: заголовок один раз, дальше только значения
+    COMPACT_HEADER = "Дата|Символ|Направление|RR|Профит$|Результат|Сессия|Позиция|Комментарий|Новости"
+
+    def render_compact(self, rows: Iterable[int], note_limit: int = 160,
+                       events: Optional[Dict[int, str]] = None) -> List[str]:
+        """
+        Строки таблицы для выбранных сделок (длинные комментарии обрезаются)
+        :param events: подписи новостей вокруг сделки по Trade.id
+        """
+        events = events or {}
+        return [
+            "|".join([
+                date.fromordinal(int(self.date_ord[row])).strftime('%Y-%m-%d'),
+                table_cell(self.value('symbol', row)),
+                table_cell(self.value('direction', row)),
+                table_cell(_from_float(self.rr[row])),
+                table_cell(_from_float(self.profit[row])),
+                table_cell(self.value('result_type', row)),
+                table_cell(self.value('session', row)),
+                table_cell(self.value('position', row)),
+                table_cell(self.notes[row], note_limit),
+                table_cell(events.get(int(self.ids[row])), note_limit),
+            ])
+            for row in (int(row) for row in rows)
+        ]
+
+
+def _to_float(value) -> float:
+    return float(value) if value is not None else np.nan
+
+
+def _from_float(value) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
@@ -0,0 +1,235 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+from .ai_modules.lru_cache import TTLCache
+from .journal import journal_version
+from .models import Trade
+from .stats import filtered_query, grouped_stats, OUTCOME_R
+
+# Стартовый баланс кривой equity
+EQUITY_START = 10000
+# Точек equity на графике по умолчанию (клиент может запросить ?points= по ширине экрана)
+EQUITY_POINTS = int(os.getenv('EQUITY_POINTS', '400'))
+MAX_EQUITY_POINTS = 5000
+
+# Результаты по (версия журнала, фильтры): после любого изменения сделок ключ меняется сам
+_cache = TTLCache(maxsize=64, ttl=3600)
+
+
+def load_columns(filters: dict) -> dict:
+    """Нужные колонки отфильтрованных сделок в порядке (date, id) одним запросом - сразу массивами"""
+    rows = filtered_query(filters) \
+        .with_entities(Trade.date, Trade.risk, Trade.rr, Trade.result_type) \
+        .order_by(Trade.date, Trade.id).all()
+
+    n = len(rows)
+    results = np.array([row[3] for row in rows], dtype=object)
+    rr = np.fromiter((row[2] or 0 for row in rows), dtype='float64', count=n)
+    is_tp = results == 'TP'
+
+    # Результат в R по общему соответствию OUTCOME_R (BE = 0R), как в дневных итогах и разбивке
+    r = np.zeros(n)
+    for result, value in OUTCOME_R.items():
+        r[results == result] = value
+    r[is_tp] = rr[is_tp]
+    return {
+        'dates': [row[0] for row in rows],
+        # Пустые risk/rr считаются нулём
+        'risk': np.fromiter((row[1] or 0 for row in rows), dtype='float64', count=n),
+        'rr': rr,
+        'r': r,
+        'is_tp': is_tp,
+        # Для серий BE, как и раньше, продолжает серию убытков
+        'is_loss': (results == 'SL') | (results == 'BE'),
+    }
+
+
+def _max_streaks(is_tp: np.ndarray, is_loss: np.ndarray):
+    """Длиннейшие серии TP и SL/BE; прочие результаты серию не прерывают"""
+    kinds = np.where(is_tp, 1, np.where(is_loss, -1, 0))
+    kinds = kinds[kinds != 0]
+    if not len(kinds):
+        return 0, 0
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(kinds)) + 1))
+    lengths = np.diff(np.append(starts, len(kinds)))
+    values = kinds[starts]
+    return int(lengths[values == 1].max(initial=0)), int(lengths[values == -1].max(initial=0))
+
+
+def _ratio(numerator: float, denominator: float):
+    # Знаменатели неотрицательные; почти нулевой (одинаковые сделки) - метрика не определена
+    return round(float(numerator / denominator), 4) if denominator > 1e-12 else None
+
+
+def _returns(columns: dict) -> np.ndarray:
+    # Доходность сделки в долях депозита: результат в R, умноженный на риск
+    return columns['r'] * columns['risk']
+
+
+def equity_series(columns: dict, start: float = EQUITY_START) -> dict:
+    """Полная кривая equity: даты сделок и баланс после каждой, первая точка - стартовый баланс без даты"""
+    returns = _returns(columns)
+    return {
+        'dates': np.array(columns['dates'], dtype='datetime64[D]'),
+        'values': np.concatenate(([float(start)], start * np.cumprod(1 + returns))),
+    }
+
+
+def compute(columns: dict, start: float = EQUITY_START) -> dict:
+    """
+    Метрики журнала векторно: доходность сделки в долях депозита,
+    equity через cumprod, просадка от накопленного максимума, серии по границам смены результата
+    """
+    risk, is_tp, is_loss = columns['risk'], columns['is_tp'], columns['is_loss']
+    n = len(risk)
+
+    returns = _returns(columns)
+    equity = start * np.cumprod(1 + returns)
+    peak = np.maximum.accumulate(np.concatenate(([start], equity)))[1:]
+    drawdown = 1 - equity / peak if n else np.zeros(0)
+
+    r_multiples = columns['r']
+    gains, losses = returns[returns > 0].sum(), -returns[returns < 0].sum()
+    std = returns.std(ddof=1) if n > 1 else 0
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2)) if n else 0
+    max_win_streak, max_loss_streak = _max_streaks(is_tp, is_loss)
+
+    final = float(equity[-1]) if n else float(start)
+    return {
+        'trades': n,
+        'winrate': round(float(is_tp.mean()) * 100, 2) if n else 0,
+        'start': start,
+        'final_equity': round(final, 2),
+        'return_pct': round((final / start - 1) * 100, 2),
+        'max_drawdown_pct': round(float(drawdown.max()) * 100, 2) if n else 0,
+        'max_drawdown': round(float((peak - equity).max()), 2) if n else 0,
+        'max_win_streak': max_win_streak,
+        'max_loss_streak': max_loss_streak,
+        'expectancy_pct': round(float(returns.mean()) * 100, 4) if n else 0,
+        'expectancy_r': round(float(r_multiples.mean()), 4) if n else 0,
+        'profit_factor': _ratio(gains, losses),
+        # Отношения на одну сделку, без приведения к году
+        'sharpe': _ratio(returns.mean(), std) if n > 1 else None,
+        'sortino': _ratio(returns.mean(), downside) if n else None,
+    }
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: индексы threshold точек, сохраняющих форму ряда.
+    Первая и последняя точки остаются, из каждой корзины между ними берётся точка
+    с наибольшей площадью треугольника с предыдущей выбранной и средним следующей корзины
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # threshold-2 корзины по точкам 1..n-2, каждая непустая, так как threshold < n
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    indices = np.empty(threshold, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x = x[end:edges[bucket + 2]].mean()
+            next_y = y[end:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+
+        area = np.abs((x[selected] - next_x) * (y[start:end] - y[selected])
+                      - (x[selected] - x[start:end]) * (next_y - y[selected]))
+        selected = start + int(area.argmax())
+        indices[bucket + 1] = selected
+    return indices
+
+
+def equity_points_arg(args) -> int:
+    points = args.get('points', type=int) or EQUITY_POINTS
+    return max(3, min(points, MAX_EQUITY_POINTS))
+
+
+def _parse_day(value):
+    try:
+        return np.datetime64(datetime.strptime(value, '%Y-%m-%d').date())
+    except (TypeError, ValueError):
+        return None
+
+
+def filters_key(filters: dict) -> tuple:
+    return tuple(sorted((name, value) for name, value in filters.items() if value))
+
+
+def _cached(filters: dict, start: float):
+    """(метрики, кривая equity) по фильтрам; кешируется по версии журнала - повторные открытия не трогают сделки"""
+    key = (journal_version(), filters_key(filters), start)
+    result = _cache.get(key)
+    if result is None:
+        columns = load_columns(filters)
+        result = compute(columns, start), equity_series(columns, start)
+        _cache.put(key, result)
+    return result
+
+
+def journal_analytics(filters: dict, start: float = EQUITY_START) -> dict:
+    """
+    Аналитика журнала по фильтрам, общая для страницы профиля и JSON API.
+    Возвращаемый словарь общий для всех вызовов, его нельзя менять
+    """
+    return _cached(filters, start)[0]
+
+
+def equity_points(filters: dict, points: int = None, zoom_from: str = None, zoom_to: str = None,
+                  start: float = EQUITY_START) -> dict:
+    """
+    Кривая equity для графика. Без zoom весь ряд прореживается LTTB до points точек;
+    с zoom_from/zoom_to возвращается срез по датам в полном разрешении (points - необязательный предел)
+    """
+    series = _cached(filters, start)[1]
+    dates, values = series['dates'], series['values']
+    day_from, day_to = _parse_day(zoom_from), _parse_day(zoom_to)
+
+    if day_from is None and day_to is None:
+        # Точка 'Start' без даты идёт первой
+        labels, iso_dates = ['Start'], [None]
+        positions = np.arange(len(values))
+        points = points or EQUITY_POINTS
+    else:
+        mask = np.ones(len(dates), dtype=bool)
+        if day_from is not None:
+            mask &= dates >= day_from
+        if day_to is not None:
+            mask &= dates <= day_to
+        # Сдвиг на 1: values[0] - стартовый баланс
+        positions = np.flatnonzero(mask) + 1
+        labels, iso_dates = [], []
+
+    if points:
+        positions = positions[lttb(positions.astype(float), values[positions], points)]
+
+    trade_days = dates[positions[positions > 0] - 1]
+    labels += [day.strftime('%d.%m') for day in trade_days.tolist()]
+    iso_dates += [day.isoformat() for day in trade_days.tolist()]
+    return {
+        'labels': labels,
+        'values': np.round(values[positions], 2).tolist(),
+        'dates': iso_dates,
+        'total': len(values),
+    }
+
+
+def journal_breakdown(filters: dict, dimensions: tuple) -> list:
+    """
+    Винрейт, средний RR и сумма R по комбинациям измерений (BREAKDOWN_DIMENSIONS) одним GROUP BY.
+    Кешируется по (измерения, фильтры, версия журнала); список общий для всех вызовов, его нельзя менять
+    """
+    key = ('breakdown', journal_version(), tuple(dimensions), filters_key(filters))
+    result = _cache.get(key)
+    if result is None:
+        result = grouped_stats(filtered_query(filters), dimensions)
+        _cache.put(key, result)
+    return result
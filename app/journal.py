@@ -0,0 +1,42 @@
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import Trade, JournalMeta
+
+_BUMP_SQL = text(
+    "INSERT INTO journal_meta (id, version) VALUES (1, 1) "
+    "ON CONFLICT (id) DO UPDATE SET version = journal_meta.version + 1"
+)
+
+
+def journal_version() -> int:
+    """Текущая версия журнала (0 - сделки ещё не менялись)"""
+    return db.session.query(JournalMeta.version).filter(JournalMeta.id == 1).scalar() or 0
+
+
+def _touches_trades(objects) -> bool:
+    return any(isinstance(obj, Trade) for obj in objects)
+
+
+def _after_flush(session, flush_context):
+    # Версия растёт в той же транзакции, что и изменение сделок: откат отменяет и её
+    if _touches_trades(session.new) or _touches_trades(session.dirty) or _touches_trades(session.deleted):
+        session.connection().execute(_BUMP_SQL)
+
+
+def _after_bulk(orm_execute_state):
+    # Query.delete()/update() обходят flush, поэтому их отслеживаем отдельно
+    if (orm_execute_state.is_delete or orm_execute_state.is_update) \
+            and any(mapper.class_ is Trade for mapper in orm_execute_state.all_mappers):
+        result = orm_execute_state.invoke_statement()
+        orm_execute_state.session.connection().execute(_BUMP_SQL)
+        return result
+    return None
+
+
+def track_journal_changes():
+    """Подписка на изменения Trade во всех сессиях; вызывается один раз из create_app"""
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+        event.listen(Session, "do_orm_execute", _after_bulk)
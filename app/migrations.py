@@ -0,0 +1,79 @@
+import logging
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+
+def _trade_indexes(conn):
+    """Индексы Trade из models.py для баз, созданных до их появления"""
+    from .models import Trade
+
+    for index in Trade.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+    # Статистика для планировщика SQLite, чтобы он выбирал между индексами по селективности
+    conn.execute(text("ANALYZE trade"))
+
+
+def _daily_rollup(conn):
+    """Таблица дневных итогов, заполненная по уже существующим сделкам"""
+    from .models import DailyStat
+    from .rollup import rebuild_rollup
+
+    DailyStat.__table__.create(bind=conn, checkfirst=True)
+    rebuild_rollup(conn)
+
+
+# Версия схемы -> (описание, функция(conn)). Новые миграции только добавляются в конец
+MIGRATIONS = [
+    (1, "индексы Trade по дате и колонкам фильтров", _trade_indexes),
+    (2, "дневные итоги по символу и сессии", _daily_rollup),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar() or 0
+
+
+def apply_migrations(engine) -> int:
+    """
+    Применяет к базе миграции новее PRAGMA user_version.
+    Миграции идемпотентны, а версия записывается только после успешного
+    выполнения, поэтому прерванный запуск повторит миграцию при следующем старте.
+    Возвращает итоговую версию схемы
+    """
+    if engine.dialect.name != "sqlite":
+        # Версия хранится в PRAGMA user_version; для других СУБД схема создаётся create_all
+        logger.warning(f"Миграции поддерживаются только для SQLite, пропуск ({engine.dialect.name})")
+        return 0
+
+    version = get_schema_version(engine)
+    for target, description, migrate in MIGRATIONS:
+        if target <= version:
+            continue
+
+        logger.info(f"Миграция схемы {version} -> {target}: {description}")
+        with engine.begin() as conn:
+            migrate(conn)
+            # PRAGMA не принимает параметры; target - целое из MIGRATIONS
+            conn.execute(text(f"PRAGMA user_version = {int(target)}"))
+        version = target
+
+    return version
+
+
+def register_cli(app):
+    """flask migrate - применить миграции, flask migrate --status - показать версию схемы"""
+    import click
+    from . import db
+
+    @app.cli.command("migrate")
+    @click.option("--status", is_flag=True, help="Только показать текущую версию схемы")
+    def migrate_command(status):
+        version = get_schema_version(db.engine)
+        if status:
+            click.echo(f"Версия схемы: {version} (последняя: {LATEST_VERSION})")
+            return
+        click.echo(f"Версия схемы: {version} -> {apply_migrations(db.engine)}")
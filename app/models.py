@@ -2,6 +2,17 @@ from . import db
 from datetime import datetime
 
 class Trade(db.Model):
+    # Индексы под запросы журнала: сортировка по (date, id) и фильтры по колонкам с той же сортировкой.
+    # id - это rowid SQLite, он неявно входит в каждый индекс, поэтому (symbol, date) покрывает и (symbol, date, id).
+    # Существующие базы получают индексы через app/migrations.py
+    __table_args__ = (
+        db.Index('ix_trade_date', 'date'),
+        db.Index('ix_trade_symbol_date', 'symbol', 'date'),
+        db.Index('ix_trade_session_date', 'session', 'date'),
+        db.Index('ix_trade_position_date', 'position', 'date'),
+        db.Index('ix_trade_result_type_date', 'result_type', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date)
     symbol = db.Column(db.String)
@@ -30,3 +41,34 @@ class Task(db.Model):
     priority = db.Column(db.String(50))
     completed = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class JournalMeta(db.Model):
+    """Версия журнала: растёт при каждом изменении сделок (ETag API, кеши статистики), см. app/journal.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+
+class DailyStat(db.Model):
+    """
+    Дневной итог журнала по (дата, символ, сессия) - ведётся в тех же транзакциях,
+    что и сделки (app/rollup.py). Пустые символ и сессия хранятся как ''
+    """
+    __tablename__ = 'daily_stat'
+
+    date = db.Column(db.Date, primary_key=True)
+    symbol = db.Column(db.String, primary_key=True, default='')
+    session = db.Column(db.String, primary_key=True, default='')
+    trades = db.Column(db.Integer, nullable=False, default=0)
+    tp = db.Column(db.Integer, nullable=False, default=0)
+    sl = db.Column(db.Integer, nullable=False, default=0)
+    be = db.Column(db.Integer, nullable=False, default=0)
+    # Сумма RR и число TP-сделок с RR - для среднего RR по TP
+    tp_rr_sum = db.Column(db.Float, nullable=False, default=0)
+    tp_rr_count = db.Column(db.Integer, nullable=False, default=0)
+    # Результат в R: TP -> +rr, SL -> -1, BE -> 0
+    r_sum = db.Column(db.Float, nullable=False, default=0)
+    # Результат в % депозита (как sum RR в журнале) и суммарный риск в %
+    pnl_pct = db.Column(db.Float, nullable=False, default=0)
+    risk_pct = db.Column(db.Float, nullable=False, default=0)
\ No newline at end of file
@@ -0,0 +1,55 @@
+import os
+from datetime import datetime
+from sqlalchemy import tuple_
+
+from .models import Trade
+
+# Размер страницы журнала: по умолчанию TRADES_PAGE_SIZE, можно переопределить ?per_page=
+DEFAULT_PAGE_SIZE = int(os.getenv('TRADES_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(trade) -> str:
+    return f"{trade.date.isoformat()}_{trade.id}"
+
+
+def decode_cursor(value):
+    """Курсор "YYYY-MM-DD_id" -> (date, id); некорректный курсор -> None (первая страница)"""
+    try:
+        day, trade_id = value.rsplit('_', 1)
+        return datetime.strptime(day, '%Y-%m-%d').date(), int(trade_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+# Сравнение row value (date, id) SQLite превращает в поиск по индексу, в отличие от OR двух условий
+def newer_than(cursor):
+    return tuple_(Trade.date, Trade.id) > tuple(cursor)
+
+
+def older_than(cursor):
+    return tuple_(Trade.date, Trade.id) < tuple(cursor)
+
+
+def page_size(args) -> int:
+    per_page = args.get('per_page', type=int) or DEFAULT_PAGE_SIZE
+    return max(1, min(per_page, MAX_PAGE_SIZE))
+
+
+def keyset_page(query, per_page: int, after=None, before=None):
+    """
+    Страница журнала по ключу (date, id) от новых к старым.
+    after - курсор последней строки предыдущей страницы, before - первой строки следующей.
+    Возвращает (сделки, есть ли более новые, есть ли более старые)
+    """
+    if before is not None:
+        # Назад: ближайшие более новые строки по возрастанию, затем разворот
+        rows = query.filter(newer_than(before)) \
+            .order_by(Trade.date.asc(), Trade.id.asc()).limit(per_page + 1).all()
+        has_newer = len(rows) > per_page
+        return list(reversed(rows[:per_page])), has_newer, True
+
+    if after is not None:
+        query = query.filter(older_than(after))
+    rows = query.order_by(Trade.date.desc(), Trade.id.desc()).limit(per_page + 1).all()
+    return rows[:per_page], after is not None, len(rows) > per_page
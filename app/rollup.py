@@ -0,0 +1,123 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable
+from sqlalchemy import case, func, insert, select, update, delete
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db
+from .models import Trade, DailyStat
+from .stats import R_MULTIPLE, r_multiple
+
+_MEASURES = ('trades', 'tp', 'sl', 'be', 'tp_rr_sum', 'tp_rr_count', 'r_sum', 'pnl_pct', 'risk_pct')
+
+
+def _trade_measures(trade) -> dict:
+    """Вклад одной сделки в дневной итог; пустые risk/rr ничего не добавляют, как SUM в SQL"""
+    result, risk, rr = trade.result_type, trade.risk, trade.rr
+    is_tp, is_sl = result == 'TP', result == 'SL'
+    pnl = 0
+    if is_tp and risk is not None and rr is not None:
+        pnl = risk * rr * 100
+    elif is_sl and risk is not None:
+        pnl = -risk * 100
+    return {
+        'trades': 1,
+        'tp': int(is_tp),
+        'sl': int(is_sl),
+        'be': int(result == 'BE'),
+        'tp_rr_sum': rr if is_tp and rr is not None else 0,
+        'tp_rr_count': int(is_tp and rr is not None),
+        'r_sum': r_multiple(result, rr),
+        'pnl_pct': pnl,
+        'risk_pct': risk * 100 if risk is not None else 0,
+    }
+
+
+def _day(value):
+    # add_trade кладёт в Date колонку datetime
+    return value.date() if isinstance(value, datetime) else value
+
+
+_UPSERT_INSERTS = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}
+
+
+def _add_delta(day, symbol, session, delta: dict):
+    """Добавление к дневному итогу без ON CONFLICT: UPDATE существующей строки, иначе INSERT"""
+    key = (DailyStat.date == day) & (DailyStat.symbol == symbol) & (DailyStat.session == session)
+    exists = db.session.execute(select(DailyStat.date).where(key)).first()
+    if exists:
+        db.session.execute(update(DailyStat).where(key).values(
+            {name: getattr(DailyStat, name) + value for name, value in delta.items()}
+        ))
+    else:
+        db.session.execute(insert(DailyStat).values(date=day, symbol=symbol, session=session, **delta))
+
+
+def apply_trades(trades: Iterable, sign: int = 1):
+    """
+    Добавляет (sign=1) или вычитает (sign=-1) сделки из дневных итогов в текущей транзакции
+    db.session - итоги фиксируются тем же commit, что и сами сделки.
+    Вызывается до commit: после удаления сделки её поля уже не прочитать
+    """
+    deltas = defaultdict(lambda: dict.fromkeys(_MEASURES, 0))
+    for trade in trades:
+        if trade.date is None:
+            continue
+        delta = deltas[(_day(trade.date), trade.symbol or '', trade.session or '')]
+        for name, value in _trade_measures(trade).items():
+            delta[name] += sign * value
+
+    if not deltas:
+        return
+
+    # INSERT ... ON CONFLICT есть у SQLite и PostgreSQL; остальные базы - через SELECT и UPDATE/INSERT
+    upsert_insert = _UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    for (day, symbol, session), delta in deltas.items():
+        if upsert_insert is None:
+            _add_delta(day, symbol, session, delta)
+            continue
+        stmt = upsert_insert(DailyStat).values(date=day, symbol=symbol, session=session, **delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DailyStat.date, DailyStat.symbol, DailyStat.session],
+            set_={name: getattr(DailyStat, name) + stmt.excluded[name] for name in _MEASURES}
+        )
+        db.session.execute(stmt)
+
+    # Дни, где не осталось сделок, не храним
+    db.session.execute(delete(DailyStat).where(DailyStat.trades <= 0))
+
+
+def rebuild_rollup(conn):
+    """Пересчёт всех дневных итогов одним INSERT ... SELECT ... GROUP BY по таблице trade"""
+    is_tp, is_sl = Trade.result_type == 'TP', Trade.result_type == 'SL'
+    symbol, session = func.coalesce(Trade.symbol, ''), func.coalesce(Trade.session, '')
+    tp_rr = case((is_tp, Trade.rr))
+
+    aggregates = select(
+        Trade.date, symbol, session,
+        func.count(),
+        func.sum(case((is_tp, 1), else_=0)),
+        func.sum(case((is_sl, 1), else_=0)),
+        func.sum(case((Trade.result_type == 'BE', 1), else_=0)),
+        func.coalesce(func.sum(tp_rr), 0),
+        func.count(tp_rr),
+        func.coalesce(func.sum(R_MULTIPLE), 0),
+        func.coalesce(func.sum(case((is_tp, Trade.risk * Trade.rr * 100), (is_sl, -Trade.risk * 100), else_=0)), 0),
+        func.coalesce(func.sum(Trade.risk * 100), 0),
+    ).where(Trade.date.isnot(None)).group_by(Trade.date, symbol, session)
+
+    conn.execute(delete(DailyStat))
+    conn.execute(insert(DailyStat).from_select(['date', 'symbol', 'session', *_MEASURES], aggregates))
+
+
+def register_cli(app):
+    """flask rollup-rebuild - пересчитать дневные итоги по всем сделкам"""
+    import click
+
+    @app.cli.command("rollup-rebuild")
+    def rollup_rebuild_command():
+        with db.engine.begin() as conn:
+            rebuild_rollup(conn)
+        days = db.session.query(func.count(func.distinct(DailyStat.date))).scalar()
+        click.echo(f"Дневные итоги пересчитаны: {days} дней")
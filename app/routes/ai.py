@@ -1,9 +1,13 @@
+import os
+import json
 import logging
+import threading
 from app import db
-from app.ai_modules.ai_client import AI_Client
 from dotenv import load_dotenv
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, request, jsonify, render_template, current_app, Response, stream_with_context, url_for
 import markdown2
+from app.ai_modules.context_packer import estimate_tokens
+from app.ai_modules.job_queue import JobQueue
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -13,31 +17,151 @@ logger = logging.getLogger(__name__)
 ai_bp = Blueprint("ai", __name__, url_prefix="/ai")
 
 trade_ai = None
-last_api_key = None
+_trade_ai_lock = threading.Lock()
+# Trade.id сделок, изменённых или удалённых, пока AI_Client строится
+_pending_lock = threading.Lock()
+_pending_ids = set()
+_building = False
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+job_queue = None
+_job_queue_lock = threading.Lock()
 
 
-def get_trade_ai(api_key: str = None):
-    global trade_ai, last_api_key
+def get_trade_ai():
+    """Единый AI_Client на процесс - ключ пользователя в нём не хранится"""
+    global trade_ai, _building
 
-    # Если ключ изменился или AI_Client не создан
-    if trade_ai is None or (api_key and api_key != last_api_key):
-        print(f"🔄 Создаем/обновляем AI_Client с новым ключом...")
-        trade_ai = AI_Client(db.session, api_key=api_key)
-        last_api_key = api_key
-    elif api_key and trade_ai:
-        # Если ключ передан, обновляем существующий
-        print(f"🔄 Обновляем API ключ в существующем AI_Client...")
-        trade_ai.set_api_key(api_key)
-        last_api_key = api_key
+    if trade_ai is None:
+        with _trade_ai_lock:
+            if trade_ai is None:
+                # faiss, numpy и модель эмбеддингов подгружаются только при первом обращении к AI
+                from app.ai_modules.ai_client import AI_Client
+
+                with _pending_lock:
+                    _building = True
+                    _pending_ids.clear()
+                try:
+                    print("🔄 Создаем AI_Client...")
+                    client = AI_Client(db.session)
+                    # Сделки, изменённые во время построения, могли не попасть в прочитанный снимок БД
+                    while True:
+                        with _pending_lock:
+                            changes = set(_pending_ids)
+                            _pending_ids.clear()
+                            if not changes:
+                                trade_ai = client
+                                break
+                        _apply_pending_changes(client, changes)
+                finally:
+                    with _pending_lock:
+                        _building = False
 
     return trade_ai
 
 
+def _apply_pending_changes(client, trade_ids: set):
+    """Сверяет отложенные сделки с БД: существующие переиндексируются, удалённые убираются из индекса"""
+    from app.models import Trade
+
+    trade_ids = list(trade_ids)
+    existing = Trade.query.filter(Trade.id.in_(trade_ids)).all()
+    found = {trade.id for trade in existing}
+    removed = [trade_id for trade_id in trade_ids if trade_id not in found]
+    if removed:
+        client.remove_trades(removed)
+    if existing:
+        client.upsert_trades(existing)
+    print(f"🔄 Применены изменения журнала во время прогрева: {len(trade_ids)} сделок")
+
+
+def get_job_queue() -> JobQueue:
+    """Очередь AI-задач на процесс; размер пула - AI_MAX_WORKERS, длина очереди - AI_MAX_PENDING"""
+    global job_queue
+
+    if job_queue is None:
+        with _job_queue_lock:
+            if job_queue is None:
+                job_queue = JobQueue(
+                    current_app._get_current_object(),
+                    max_workers=int(os.getenv("AI_MAX_WORKERS", "2")),
+                    max_pending=int(os.getenv("AI_MAX_PENDING", "20")),
+                )
+
+    return job_queue
+
+
+def is_ai_warming_up() -> bool:
+    return _warmup_thread is not None and _warmup_thread.is_alive()
+
+
+def start_ai_warmup(app):
+    """
+    Фоновая загрузка модели и индексов, чтобы первый запрос к AI не ждал.
+    Повторный вызов во время прогрева ничего не делает.
+    """
+    global _warmup_thread
+
+    with _warmup_lock:
+        if trade_ai is not None or is_ai_warming_up():
+            return
+
+        def warmup():
+            with app.app_context():
+                try:
+                    engine = get_trade_ai()
+                    # Модель нужна для эмбеддинга запросов даже при тёплом старте из снимка
+                    engine.embedding_model
+                    print("✅ AI система прогрета")
+                except Exception as e:
+                    logger.error(f"[AI] Ошибка прогрева: {e}", exc_info=True)
+                finally:
+                    db.session.remove()
+
+        _warmup_thread = threading.Thread(target=warmup, name="ai-warmup", daemon=True)
+        _warmup_thread.start()
+
+
+def sync_trade_index(upserted=None, removed_ids=None):
+    """
+    Передаёт изменения журнала в векторный индекс AI.
+    Если AI_Client ещё не создан, индекс построится из БД при первом запросе;
+    если он строится прямо сейчас, изменения откладываются и применяются после построения.
+    """
+    with _pending_lock:
+        engine = trade_ai
+        if engine is None:
+            if _building:
+                _pending_ids.update(int(trade_id) for trade_id in removed_ids or ())
+                _pending_ids.update(trade.id for trade in upserted or ())
+            return
+
+    try:
+        if removed_ids:
+            engine.remove_trades(removed_ids)
+        if upserted:
+            engine.upsert_trades(upserted)
+    except Exception as e:
+        logger.error(f"[AI] Не удалось обновить индекс сделок: {e}", exc_info=True)
+
+
 @ai_bp.route("/", methods=["GET"])
 def ai_home():
     return render_template("ai_helper.html")
 
 
+@ai_bp.route("/status", methods=["GET"])
+def ai_status():
+    # Готова, только когда прогрев (индексы и модель эмбеддингов) завершился
+    warming_up = is_ai_warming_up()
+    status = {"ready": trade_ai is not None and not warming_up, "warming_up": warming_up}
+    if trade_ai is not None:
+        status.update(trade_ai.stats())
+    if job_queue is not None:
+        status["jobs"] = job_queue.stats()
+    return jsonify(status)
+
+
 def render_markdown_safe(text: str) -> str:
     return markdown2.markdown(
         text,
@@ -45,31 +169,154 @@ def render_markdown_safe(text: str) -> str:
     )
 
 
-@ai_bp.route("/ask", methods=["POST"])
-def ai_ask():
-    data = request.get_json()
+def _parse_ask_request():
+    """
+    Общая проверка запроса к AI.
+    Возвращает (текст, ключ, None) или (None, None, ответ с ошибкой)
+    """
+    data = request.get_json(silent=True) or {}
     user_text = (data.get("text") or "").strip()
     api_key = (data.get("api_key") or "").strip()
 
-    print(f"🎯 Получен запрос: {user_text}")
-    print(f"🔑 Получен API ключ: {api_key[:20] if api_key else 'NO KEY'}...")
+    # Ключ пользователя не логируется ни целиком, ни частично
+    logger.debug(f"[AI] Получен запрос: {user_text}")
 
     if not user_text:
-        return jsonify({"error": "Введите текст запроса."}), 400
+        return None, None, (jsonify({"error": "Введите текст запроса."}), 400)
 
     if not api_key:
-        return jsonify({"error": "API ключ не передан в запросе."}), 400
+        return None, None, (jsonify({"error": "API ключ не передан в запросе."}), 400)
 
-    try:
-        ai_engine = get_trade_ai(api_key=api_key)
+    if trade_ai is None or is_ai_warming_up():
+        # Не блокируем запрос на время загрузки модели - клиент повторит его позже.
+        # trade_ai появляется раньше, чем прогрев загрузит модель, поэтому ждём конца прогрева
+        start_ai_warmup(current_app._get_current_object())
+        return None, None, (jsonify({"status": "warming_up", "message": "AI система загружается, подождите несколько секунд..."}), 503)
 
-        print(f"✅ AI_Client готов. API ключ: {ai_engine.api_key[:20] if ai_engine.api_key else 'NO KEY'}...")
+    return user_text, api_key, None
 
-        response = ai_engine.analyze(user_text)
 
-        html_response = render_markdown_safe(response)
-        return jsonify({"response": html_response, "mode": "trades"})
+def _token_budget():
+    """Необязательный бюджет токенов контекста из запроса (по умолчанию AI_CONTEXT_TOKENS)"""
+    return (request.get_json(silent=True) or {}).get("max_context_tokens")
 
-    except Exception as e:
-        logger.error(f"[AI] Критическая ошибка: {e}", exc_info=True)
-        return jsonify({"error": f"Системная ошибка: {str(e)}"}), 500
\ No newline at end of file
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _run_ai_job(job, user_text: str, api_key: str, token_budget):
+    """Выполнение запроса к AI в воркере очереди: текст накапливается в задаче по мере генерации"""
+    ai_engine = get_trade_ai()
+    prompt, usage = ai_engine.build_prompt(user_text, token_budget=token_budget)
+    for delta in ai_engine.analyze_stream(user_text, api_key=api_key, prompt=prompt):
+        job.append(delta)
+
+    usage["completion_tokens"] = estimate_tokens(job.text)
+    job.finish(html=render_markdown_safe(job.text.strip()), usage=usage)
+
+
+def _enqueue_ask():
+    """Проверка запроса и постановка задачи в очередь. Возвращает (задача, None) или (None, ответ с ошибкой)"""
+    user_text, api_key, error = _parse_ask_request()
+    if error:
+        return None, error
+
+    job = get_job_queue().submit(_run_ai_job, user_text, api_key, _token_budget())
+    if job is None:
+        return None, (jsonify({"error": "Слишком много запросов к AI, попробуйте через минуту."}), 429)
+    return job, None
+
+
+def _job_events(job):
+    """
+    События задачи в формате SSE:
+    status - в очереди / выполняется, delta - очередной фрагмент текста,
+    html - отрендеренный markdown готовых абзацев, done - финальный HTML и расход токенов, error - ошибка
+    """
+    queue = get_job_queue()
+    sent = 0
+    status = None
+
+    while True:
+        text, new_status = job.wait(sent, status)
+        changed = False
+
+        if new_status != status:
+            status = new_status
+            changed = True
+            if status in ("queued", "running"):
+                yield _sse("status", {"status": status, "position": queue.position(job)})
+
+        if len(text) > sent:
+            delta = text[sent:]
+            sent = len(text)
+            changed = True
+            yield _sse("delta", {"text": delta})
+
+            # Markdown перерисовываем на границах строк, а не на каждый токен
+            if "\n" in delta:
+                rendered_text = text[:text.rfind("\n") + 1]
+                # Смещение в UTF-16 единицах, как считает длину строки JavaScript (эмодзи - 2 единицы)
+                rendered_upto = len(rendered_text.encode("utf-16-le")) // 2
+                yield _sse("html", {"html": render_markdown_safe(rendered_text), "rendered": rendered_upto})
+
+        if status == "done":
+            yield _sse("done", {"html": job.html, "mode": "trades", "usage": job.usage})
+            return
+        if status == "error":
+            yield _sse("error", {"error": job.error})
+            return
+
+        if not changed:
+            # Комментарий SSE не даёт прокси закрыть долгое соединение
+            yield ": keep-alive\n\n"
+
+
+def _job_stream_response(job) -> Response:
+    return Response(
+        stream_with_context(_job_events(job)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@ai_bp.route("/ask", methods=["POST"])
+def ai_ask():
+    """Ставит запрос в очередь и сразу возвращает id задачи; результат - через /ai/jobs/<id>"""
+    job, error = _enqueue_ask()
+    if error:
+        return error
+
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": url_for("ai.ai_job_status", job_id=job.id),
+        "stream_url": url_for("ai.ai_job_stream", job_id=job.id),
+    }), 202
+
+
+@ai_bp.route("/ask/stream", methods=["POST"])
+def ai_ask_stream():
+    """Тот же запрос через очередь, но события задачи отдаются сразу в ответе (SSE)"""
+    job, error = _enqueue_ask()
+    if error:
+        return error
+    return _job_stream_response(job)
+
+
+@ai_bp.route("/jobs/<job_id>", methods=["GET"])
+def ai_job_status(job_id):
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Задача не найдена или устарела."}), 404
+    return jsonify(job.to_dict(position=queue.position(job)))
+
+
+@ai_bp.route("/jobs/<job_id>/stream", methods=["GET"])
+def ai_job_stream(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Задача не найдена или устарела."}), 404
+    return _job_stream_response(job)
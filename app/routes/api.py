@@ -0,0 +1,153 @@
+import hashlib
+from flask import Blueprint, request, jsonify, url_for, Response
+from ..journal import journal_version
+from ..stats import parse_filters, filtered_query, journal_summary, BREAKDOWN_DIMENSIONS
+from ..pagination import encode_cursor, decode_cursor, page_size, keyset_page
+from ..analytics import journal_analytics, journal_breakdown, equity_points, equity_points_arg
+from ..simulation import journal_simulation, MAX_PATHS, MAX_TRADES, MAX_SAMPLES
+
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+
+def _trade_json(trade) -> dict:
+    """Поля строки журнала для таблицы на клиенте"""
+    screenshot = trade.screenshot_1h_path or trade.screenshot_5m_path or trade.screenshot_3m_path
+    return {
+        'id': trade.id,
+        'date': trade.date.isoformat() if trade.date else None,
+        'symbol': trade.symbol,
+        'session': trade.session,
+        'position': trade.position,
+        'bias': trade.bias,
+        'risk': trade.risk,
+        'rr': trade.rr,
+        'result_type': trade.result_type,
+        'url': url_for('trades.trade_detail', trade_id=trade.id),
+        'screenshot_url': url_for('static', filename=screenshot) if screenshot else None,
+    }
+
+
+def _etag(version: int) -> str:
+    """ETag зависит от версии журнала, пути и параметров запроса (фильтры, курсор, размер страницы)"""
+    args = "&".join(f"{key}={value}" for key, value in sorted(request.args.items(multi=True)))
+    return hashlib.sha1(f"{version}{request.path}?{args}".encode("utf-8")).hexdigest()[:20]
+
+
+def _not_modified(etag: str):
+    """Ответ 304, если клиент уже держит актуальную версию, иначе None"""
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def _cached_json(payload: dict, etag: str):
+    response = jsonify(payload)
+    response.set_etag(etag)
+    # Кешировать можно, но каждый раз сверяясь с сервером
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@api_bp.route('/trades')
+def trades():
+    """
+    Страница журнала в JSON: те же фильтры, что и у журнала, курсор after, per_page.
+    Пока журнал не менялся, повторный запрос с If-None-Match получает 304 без запросов к сделкам
+    """
+    etag = _etag(journal_version())
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    filters = parse_filters(request.args)
+    query = filtered_query(filters)
+    cursor = decode_cursor(request.args.get('after'))
+    rows, _, has_more = keyset_page(query, page_size(request.args), after=cursor)
+
+    payload = {
+        'items': [_trade_json(trade) for trade in rows],
+        'next_cursor': encode_cursor(rows[-1]) if rows and has_more else None,
+    }
+    # Итоги нужны один раз на набор фильтров - отдаём их с первой страницей
+    if cursor is None:
+        payload['totals'] = journal_summary(filters)
+
+    return _cached_json(payload, etag)
+
+
+@api_bp.route('/analytics')
+def analytics():
+    """Метрики профиля (equity, просадка, серии, expectancy, profit factor, Sharpe) по фильтрам журнала"""
+    etag = _etag(journal_version())
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+    return _cached_json(journal_analytics(parse_filters(request.args)), etag)
+
+
+@api_bp.route('/equity')
+def equity():
+    """
+    Кривая equity по фильтрам журнала: ?points= - прореживание LTTB под ширину графика,
+    ?zoom_from=&zoom_to= - срез по датам в полном разрешении (с points - прорежённый)
+    """
+    etag = _etag(journal_version())
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    zoom_from, zoom_to = request.args.get('zoom_from'), request.args.get('zoom_to')
+    zoomed = zoom_from or zoom_to
+    points = equity_points_arg(request.args) if 'points' in request.args or not zoomed else None
+    return _cached_json(equity_points(parse_filters(request.args), points, zoom_from, zoom_to), etag)
+
+
+@api_bp.route('/breakdown')
+def breakdown():
+    """
+    Статистика журнала в разрезе измерений: ?by=weekday,session,logic,result_type (любые из
+    BREAKDOWN_DIMENSIONS) плюс обычные фильтры журнала. Основа для тепловых карт.
+    Измерений мало, и все группы считаются одним GROUP BY, поэтому их число не ограничено
+    """
+    dimensions = tuple(dict.fromkeys(name.strip() for name in request.args.get('by', '').split(',') if name.strip()))
+    unknown = [name for name in dimensions if name not in BREAKDOWN_DIMENSIONS]
+    if not dimensions or unknown:
+        return jsonify({
+            'error': 'Укажите одно или несколько измерений в by.',
+            'dimensions': list(BREAKDOWN_DIMENSIONS),
+        }), 400
+
+    etag = _etag(journal_version())
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    rows = journal_breakdown(parse_filters(request.args), dimensions)
+    return _cached_json({'dimensions': list(dimensions), 'rows': rows}, etag)
+
+
+@api_bp.route('/simulation')
+def simulation():
+    """
+    Монте-Карло по исходам сделок журнала (те же фильтры): ?paths= (до 100k), ?trades= (длина пути,
+    paths * trades не больше MAX_SIMULATION_SIZE, иначе 400),
+    ?risk= (доля депозита на сделку, по умолчанию медианный риск журнала), ?ruin= (доля потери депозита),
+    ?samples= (сколько путей вернуть целиком для графика)
+    """
+    etag = _etag(journal_version())
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    paths = max(1, min(request.args.get('paths', 10_000, type=int), MAX_PATHS))
+    trades = max(1, min(request.args.get('trades', 250, type=int), MAX_TRADES))
+    samples = max(0, min(request.args.get('samples', 0, type=int), MAX_SAMPLES))
+    try:
+        result = journal_simulation(parse_filters(request.args), paths, trades,
+                                    risk=request.args.get('risk', type=float),
+                                    ruin=request.args.get('ruin', 0.5, type=float), samples=samples)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return _cached_json(result, etag)
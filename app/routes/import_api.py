@@ -4,6 +4,7 @@ import os
 import requests
 from werkzeug.utils import secure_filename
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from ..rollup import apply_trades
 
 def download_image(image_url, filepath):
     try:
@@ -173,6 +174,8 @@ def import_notion_trades(notion_token, database_id, db, Trade):
                     imported_trades.append(trade)
                     existing_trades_keys.add((trade.date, trade.symbol))
 
+        # Дневные итоги обновляются тем же commit, что и импортированные сделки
+        apply_trades(imported_trades)
         db.session.commit()
         print(f"[+] Успешно импортировано {len(imported_trades)} сделок")
         return imported_trades
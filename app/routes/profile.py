@@ -1,57 +1,27 @@
-from flask import Blueprint, render_template
-from ..models import Trade
+from flask import Blueprint, render_template, request
+from ..stats import parse_filters, journal_summary
+from ..analytics import journal_analytics, equity_points, equity_points_arg
 
 
 profile_bp = Blueprint('profile', __name__)
 
 @profile_bp.route('/profile')
 def profile():
-    trades = Trade.query.order_by(Trade.date).all()
-    total_trades = len(trades)
-    tp_trades = sum(1 for t in trades if t.result_type == 'TP')
-    loss_trades = total_trades - tp_trades
+    # Те же фильтры, что и на странице журнала; итоги - из дневных сводок, серии, баланс и метрики - из analytics
+    filters = parse_filters(request.args)
+    stats = journal_summary(filters)
+    analytics = journal_analytics(filters)
+    # Кривая прорежена до числа точек, которое реально видно на графике
+    equity = equity_points(filters, equity_points_arg(request.args))
 
     winrate_data = {
         'labels': ['TP', 'Loss'],
-        'data': [tp_trades, loss_trades],
+        'data': [stats['tp'], stats['loss']],
     }
-    rr_sum = 0
-    rr_tp_values = []
 
-    for t in trades:
-        # Финансовый эффект от сделки в %
-        pnl_percent = t.risk * t.rr * 100 if t.result_type == 'TP' else -t.risk * 100 if t.result_type == 'SL' else 0
-        rr_sum += pnl_percent
-
-        if t.result_type == 'TP':
-            rr_tp_values.append(t.rr)  # тут оставляем чистый RR, не % (средний RR не должен быть в процентах)
-
-    rr_sum = round(rr_sum, 2)
-    rr_avg = round(sum(rr_tp_values) / len(rr_tp_values), 2) if rr_tp_values else 0
-    max_win_streak = max_loss_streak = current_win = current_loss = 0
-    for t in trades:
-        if t.result_type == 'TP':
-            current_win += 1
-            current_loss = 0
-        elif t.result_type in ['SL', 'BE']:
-            current_loss += 1
-            current_win = 0
-        max_win_streak = max(max_win_streak, current_win)
-        max_loss_streak = max(max_loss_streak, current_loss)
-
-    equity = 10000
-    equity_data = [equity]
-    equity_dates = ['Start']
-    for t in trades:
-        risk = float(t.risk) if t.risk else 0
-        rr = float(t.rr) if t.rr else 0
-        pnl = equity * rr * risk if t.result_type == 'TP' else -equity * risk if t.result_type in ['SL', 'BE'] else 0
-        equity += pnl
-        equity = round(equity, 2)
-        equity_data.append(equity)
-        equity_dates.append(t.date.strftime('%d.%m'))
-
-    return render_template('profile/profile.html', total_trades=total_trades, winrate_data=winrate_data,
-                           rr_sum=round(rr_sum, 2), rr_avg=rr_avg,
-                           max_win_streak=max_win_streak, max_loss_streak=max_loss_streak,
-                           equity_data=equity_data, equity_labels=equity_dates)
\ No newline at end of file
+    return render_template('profile/profile.html', total_trades=stats['count'], winrate_data=winrate_data,
+                           rr_sum=stats['rr_sum'], rr_avg=stats['rr_avg'],
+                           max_win_streak=analytics['max_win_streak'], max_loss_streak=analytics['max_loss_streak'],
+                           equity_data=equity['values'], equity_labels=equity['labels'],
+                           equity_total=equity['total'],
+                           analytics=analytics)
\ No newline at end of file
@@ -1,92 +1,90 @@
 from flask import Blueprint, render_template, request, redirect, url_for, current_app, flash, jsonify
 from ..models import Trade
 from .. import db
+from ..stats import FILTER_COLUMNS, parse_filters, filtered_query, journal_summary
+from ..rollup import apply_trades
+from ..pagination import encode_cursor, decode_cursor, newer_than, page_size, keyset_page
 from datetime import datetime, date
 from .import_api import import_notion_trades
+from .ai import sync_trade_index
+from ..ai_modules.calendar_store import CALENDAR_WINDOW_HOURS, get_calendar_store, trade_anchor, event_time_utc
 import os
 from werkzeug.utils import secure_filename
 
 trades_bp = Blueprint('trades', __name__)
 import_bp = Blueprint('import_api', __name__)
-@trades_bp.route('/')
-def index():
-    query = Trade.query
-    current_date = date.today().isoformat()
 
-    # Получаем фильтры из запроса
-    filters = {
-        'symbol': request.args.get('symbol'),
-        'session': request.args.get('session'),
-        'position': request.args.get('position'),
-        'result_type': request.args.get('result_type'),
-        'date_from': request.args.get('date_from'),
-        'date_to': request.args.get('date_to'),
-    }
 
-    # Применяем фильтры
-    if filters['symbol']:
-        query = query.filter_by(symbol=filters['symbol'])
-    if filters['session']:
-        query = query.filter_by(session=filters['session'])
-    if filters['position']:
-        query = query.filter_by(position=filters['position'])
-    if filters['result_type']:
-        query = query.filter_by(result_type=filters['result_type'])
+def _filter_facets() -> dict:
+    """Уникальные значения для фильтров — SELECT DISTINCT по всем сделкам"""
+    unique = {}
+    for column in FILTER_COLUMNS:
+        field = getattr(Trade, column)
+        values = db.session.query(field).filter(field.isnot(None), field != '').distinct().order_by(field)
+        unique[column + 's'] = [value for (value,) in values]
+    return unique
 
 
-    # Фильтрация по дате FROM
-    if filters['date_from']:
-        try:
-            date_from = datetime.strptime(filters['date_from'], '%Y-%m-%d').date()
-            query = query.filter(Trade.date >= date_from)
-        except ValueError:
-            pass
+@trades_bp.route('/')
+def index():
+    current_date = date.today().isoformat()
 
-    # Фильтрация по дате TO
-    if filters['date_to']:
-        try:
-            date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d').date()
-            query = query.filter(Trade.date <= date_to)
-        except ValueError:
-            pass
-
-    trades = query.order_by(Trade.date.desc()).all()
-
-    rr_sum = 0
-    rr_tp_values = []
-
-    for t in trades:
-        # Финансовый эффект от сделки в %
-        pnl_percent = t.risk * t.rr * 100 if t.result_type == 'TP' else -t.risk * 100 if t.result_type == 'SL' else 0
-        rr_sum += pnl_percent
-
-        if t.result_type == 'TP':
-            rr_tp_values.append(t.rr)  # тут оставляем чистый RR, не % (средний RR не должен быть в процентах)
-
-    rr_sum = round(rr_sum, 2)
-    rr_avg = round(sum(rr_tp_values) / len(rr_tp_values), 2) if rr_tp_values else 0
-
-    # Уникальные значения для фильтров — берем по всем сделкам
-    all_trades = Trade.query.all()
-    unique = {
-        'symbols': sorted(set(t.symbol for t in all_trades if t.symbol)),
-        'sessions': sorted(set(t.session for t in all_trades if t.session)),
-        'positions': sorted(set(t.position for t in all_trades if t.position)),
-        'result_types': sorted(set(t.result_type for t in all_trades if t.result_type)),
+    # Получаем фильтры из запроса
+    filters = parse_filters(request.args)
+    query = filtered_query(filters)
+    per_page = page_size(request.args)
+
+    trades, has_newer, has_older = keyset_page(
+        query, per_page,
+        after=decode_cursor(request.args.get('after')),
+        before=decode_cursor(request.args.get('before'))
+    )
+
+    # Итоги по всем отфильтрованным сделкам, независимо от страницы
+    totals = journal_summary(filters)
+    # Номер первой строки страницы - число более новых сделок под фильтром
+    offset = query.filter(newer_than((trades[0].date, trades[0].id))).count() if trades and has_newer else 0
+
+    # Ссылки на соседние страницы сохраняют фильтры
+    link_args = {key: value for key, value in filters.items() if value}
+    if request.args.get('per_page'):
+        link_args['per_page'] = per_page
+    pagination = {
+        'offset': offset,
+        'per_page': per_page,
+        'newer_url': url_for('trades.index', before=encode_cursor(trades[0]), **link_args)
+        if trades and has_newer else None,
+        'older_url': url_for('trades.index', after=encode_cursor(trades[-1]), **link_args)
+        if trades and has_older else None,
     }
 
     return render_template('index.html',
                            trades=trades,
-                           rr_sum=rr_sum,
-                           rr_avg=rr_avg,
+                           rr_sum=totals['rr_sum'],
+                           rr_avg=totals['rr_avg'],
+                           total_count=totals['count'],
+                           pagination=pagination,
                            filters=filters,
-                           unique=unique,
+                           unique=_filter_facets(),
                            current_date=current_date)
 
 @trades_bp.route('/trade/<int:trade_id>')
 def trade_detail(trade_id):
     trade = Trade.query.get_or_404(trade_id)
-    return render_template('trades/detail.html', trade=trade)
+
+    # Важные новости USD вокруг сделки - из локального календаря, без запросов в сеть
+    events = []
+    if trade.date:
+        try:
+            anchor = trade_anchor(trade.date, trade.session)
+            events = get_calendar_store().events_near([(trade.id, anchor)]).get(trade.id, [])
+        except Exception as e:
+            current_app.logger.error(f"Не удалось загрузить новости календаря: {e}")
+    for event in events:
+        event["time_utc"] = event_time_utc(event)
+
+    return render_template('trades/detail.html', trade=trade, events=events,
+                           window_hours=CALENDAR_WINDOW_HOURS)
 
 
 @trades_bp.route('/add_trade', methods=['GET', 'POST'])
@@ -141,7 +139,9 @@ def add_trade():
             screenshot_3m_path=screenshot_3m_path
         )
         db.session.add(trade)
+        apply_trades([trade])
         db.session.commit()
+        sync_trade_index(upserted=[trade])
         return redirect(url_for('trades.index'))
 
     sessions = ['ASIA', 'LONDON', 'NY']
@@ -175,6 +175,7 @@ def import_notion():
 
         try:
             imported_trades = import_notion_trades(NOTION_TOKEN, NOTION_DATABASE_ID, db, Trade)
+            sync_trade_index(upserted=imported_trades)
             flash(f"Успешно импортировано {len(imported_trades)} сделок из Notion", 'success')
             return redirect(url_for('trades.index'))
         except Exception as e:
@@ -197,9 +198,14 @@ def delete_multiple_trades():
         # Преобразуем ID в integers
         trade_ids = [int(tid) for tid in trade_ids]
 
-        # Удаляем выбранные сделки
+        # Удаляем выбранные сделки, вычитая их из дневных итогов в той же транзакции
+        deleted = Trade.query.filter(Trade.id.in_(trade_ids)).with_entities(
+            Trade.date, Trade.symbol, Trade.session, Trade.risk, Trade.rr, Trade.result_type
+        ).all()
+        apply_trades(deleted, sign=-1)
         deleted_count = Trade.query.filter(Trade.id.in_(trade_ids)).delete()
         db.session.commit()
+        sync_trade_index(removed_ids=trade_ids)
 
         return jsonify({'success': True, 'deleted_count': deleted_count})
 
@@ -0,0 +1,128 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .ai_modules.lru_cache import TTLCache
+from .analytics import load_columns, filters_key
+from .journal import journal_version
+
+# Размер блока путей: путей в блоке * сделок в пути не больше MONTE_CARLO_CHUNK чисел float32 (~4 байта каждое)
+CHUNK_ELEMENTS = int(os.getenv('MONTE_CARLO_CHUNK', '4000000'))
+# Процессов для симуляции; 1 - считать в текущем процессе
+WORKERS = int(os.getenv('MONTE_CARLO_WORKERS', '1'))
+MAX_PATHS = 100_000
+MAX_TRADES = 5_000
+# Предел путей * сделок для запроса из API: симуляция считается синхронно в обработчике запроса
+MAX_SIMULATION_SIZE = int(os.getenv('MONTE_CARLO_MAX_SIZE', '10000000'))
+MAX_SAMPLES = 50
+DRAWDOWN_QUANTILES = (50, 75, 90, 95, 99)
+EQUITY_QUANTILES = (5, 25, 50, 75, 95)
+
+_cache = TTLCache(maxsize=16, ttl=3600)
+
+
+def journal_outcomes(filters: dict):
+    """
+    Исходы сделок журнала в R (общее соответствие OUTCOME_R: TP -> +rr, SL -> -1, BE -> 0)
+    и медианный риск сделки в долях депозита
+    """
+    columns = load_columns(filters)
+    outcomes = columns['r']
+    risk = columns['risk'][columns['risk'] > 0]
+    return outcomes, float(np.median(risk)) if len(risk) else 0.01
+
+
+def _simulate_chunk(log_growth: np.ndarray, paths: int, trades: int, ruin_log: float, seed, samples: int = 0):
+    """
+    Блок путей одной матрицей paths x trades: случайные номера исходов -> лог-рост -> cumsum.
+    Возвращает макс. просадку, итоговый баланс (доля от старта), признак разорения и первые samples путей
+    """
+    rng = np.random.default_rng(seed)
+    log_equity = log_growth[rng.integers(0, len(log_growth), size=(paths, trades), dtype=np.int32)]
+    np.cumsum(log_equity, axis=1, out=log_equity)
+
+    final = np.exp(log_equity[:, -1])
+    ruined = log_equity.min(axis=1) <= ruin_log
+    sample = np.exp(log_equity[:samples]) if samples else None
+
+    # Пик считается и от стартового баланса (лог 0), поэтому просадка есть и у путей, ушедших вниз сразу
+    peak = np.maximum.accumulate(log_equity, axis=1)
+    np.maximum(peak, 0, out=peak)
+    np.subtract(log_equity, peak, out=log_equity)
+    max_drawdown = 1 - np.exp(log_equity.min(axis=1))
+    return max_drawdown, final, ruined, sample
+
+
+def simulate(outcomes: np.ndarray, paths: int = 10_000, trades: int = 250, risk: float = 0.01,
+             ruin: float = 0.5, seed: int = 0, workers: int = None, samples: int = 0) -> dict:
+    """
+    Монте-Карло бутстреп: paths путей по trades сделок, исходы выбираются из outcomes с возвращением.
+    Каждая сделка меняет баланс на risk * R от текущего (реинвестирование, как на кривой equity).
+    Разорение - баланс хотя бы раз опустился до (1 - ruin) от стартового.
+    Пути считаются блоками по CHUNK_ELEMENTS чисел, блоки можно раздать в пул процессов
+    """
+    if not len(outcomes):
+        raise ValueError("Нет сделок для симуляции")
+    if not 0 < risk < 1 or not 0 < ruin < 1:
+        raise ValueError("risk и ruin должны быть в интервале (0, 1)")
+
+    started = time.perf_counter()
+    # Лог-рост по каждому исходу считается один раз; исход -1R при риске < 1 не даёт log(0)
+    log_growth = np.log1p(risk * np.asarray(outcomes, dtype='float64')).astype('float32')
+    ruin_log = float(np.log1p(-ruin))
+
+    chunk = max(1, CHUNK_ELEMENTS // trades)
+    sizes = [min(chunk, paths - offset) for offset in range(0, paths, chunk)]
+    # Независимые потоки случайных чисел для блоков: результат не зависит от числа процессов
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(log_growth, size, trades, ruin_log, block_seed, samples if index == 0 else 0)
+            for index, (size, block_seed) in enumerate(zip(sizes, seeds))]
+
+    workers = WORKERS if workers is None else workers
+    if workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(args))) as pool:
+            results = list(pool.map(_simulate_chunk, *zip(*args)))
+    else:
+        results = [_simulate_chunk(*block) for block in args]
+
+    max_drawdown = np.concatenate([result[0] for result in results])
+    final = np.concatenate([result[1] for result in results])
+    ruined = np.concatenate([result[2] for result in results])
+    sample = results[0][3]
+
+    return {
+        'paths': paths,
+        'trades': trades,
+        'risk': risk,
+        'ruin': ruin,
+        'outcomes': len(outcomes),
+        'risk_of_ruin': round(float(ruined.mean()) * 100, 2),
+        'max_drawdown': {f'p{q}': round(float(value) * 100, 2)
+                         for q, value in zip(DRAWDOWN_QUANTILES, np.percentile(max_drawdown, DRAWDOWN_QUANTILES))},
+        # Итоговый баланс в % от стартового
+        'final_equity': {f'p{q}': round(float(value) * 100, 2)
+                         for q, value in zip(EQUITY_QUANTILES, np.percentile(final, EQUITY_QUANTILES))},
+        'sample_paths': np.round(sample * 100, 2).tolist() if sample is not None else [],
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def journal_simulation(filters: dict, paths: int, trades: int, risk: float = None,
+                       ruin: float = 0.5, samples: int = 0) -> dict:
+    """
+    Симуляция по исходам отфильтрованных сделок; risk по умолчанию - медианный риск журнала.
+    Seed фиксирован, поэтому результат кешируется по версии журнала и параметрам.
+    paths * trades ограничено MAX_SIMULATION_SIZE
+    """
+    if paths * trades > MAX_SIMULATION_SIZE:
+        raise ValueError(f"Слишком большая симуляция: paths * trades должно быть не больше {MAX_SIMULATION_SIZE}")
+
+    key = (journal_version(), filters_key(filters), paths, trades, risk, ruin, samples)
+    result = _cache.get(key)
+    if result is None:
+        outcomes, journal_risk = journal_outcomes(filters)
+        result = simulate(outcomes, paths, trades, risk or journal_risk, ruin, samples=samples)
+        _cache.put(key, result)
+    return result
@@ -0,0 +1,142 @@
+from datetime import datetime
+from sqlalchemy import case, func
+
+from .models import Trade, DailyStat
+
+# Колонки, по которым журнал фильтруется точным совпадением
+FILTER_COLUMNS = ('symbol', 'session', 'position', 'result_type')
+
+
+def parse_filters(args) -> dict:
+    """Фильтры журнала из query string (общие для журнала, профиля и API)"""
+    return {
+        'symbol': args.get('symbol'),
+        'session': args.get('session'),
+        'position': args.get('position'),
+        'result_type': args.get('result_type'),
+        'date_from': args.get('date_from'),
+        'date_to': args.get('date_to'),
+    }
+
+
+def filtered_query(filters: dict):
+    """Запрос сделок с фильтрами журнала (без сортировки и пагинации)"""
+    query = Trade.query
+    for column in FILTER_COLUMNS:
+        if filters.get(column):
+            query = query.filter(getattr(Trade, column) == filters[column])
+    return _filter_dates(query, Trade.date, filters)
+
+
+def _filter_dates(query, column, filters: dict):
+    # Фильтрация по дате FROM / TO; некорректная дата игнорируется
+    for key, compare in (('date_from', column.__ge__), ('date_to', column.__le__)):
+        if filters.get(key):
+            try:
+                query = query.filter(compare(datetime.strptime(filters[key], '%Y-%m-%d').date()))
+            except ValueError:
+                pass
+    return query
+
+
+# Финансовый эффект от сделки в %: TP -> +risk*rr, SL -> -risk, остальное 0
+PNL_PERCENT = case(
+    (Trade.result_type == 'TP', Trade.risk * Trade.rr * 100),
+    (Trade.result_type == 'SL', -Trade.risk * 100),
+    else_=0
+)
+# Средний RR считаем по чистому RR TP-сделок, не в процентах
+TP_RR = case((Trade.result_type == 'TP', Trade.rr))
+
+
+def _aggregates():
+    return (
+        func.count(Trade.id).label('count'),
+        func.sum(case((Trade.result_type == 'TP', 1), else_=0)).label('tp'),
+        func.sum(case((Trade.result_type == 'SL', 1), else_=0)).label('sl'),
+        func.sum(case((Trade.result_type == 'BE', 1), else_=0)).label('be'),
+        func.sum(PNL_PERCENT).label('rr_sum'),
+        func.avg(TP_RR).label('rr_avg'),
+    )
+
+
+def _stats_row(row) -> dict:
+    count, tp = row.count or 0, row.tp or 0
+    return {
+        'count': count,
+        'tp': tp,
+        'sl': row.sl or 0,
+        'be': row.be or 0,
+        # Всё, что не TP, на графике винрейта считается убытком
+        'loss': count - tp,
+        'winrate': round(tp / count * 100, 2) if count else 0,
+        'rr_sum': round(row.rr_sum or 0, 2),
+        'rr_avg': round(row.rr_avg or 0, 2),
+    }
+
+
+def journal_stats(query) -> dict:
+    """Счётчики результатов, сумма и средний RR по отфильтрованным сделкам одним агрегатным запросом"""
+    return _stats_row(query.with_entities(*_aggregates()).order_by(None).one())
+
+
+def journal_summary(filters: dict) -> dict:
+    """
+    journal_stats по фильтрам журнала. Если фильтры есть в дневных итогах (символ, сессия, даты),
+    читаются O(дней) строк DailyStat, иначе считается по сделкам
+    """
+    if filters.get('position') or filters.get('result_type'):
+        return journal_stats(filtered_query(filters))
+
+    query = DailyStat.query
+    for column in ('symbol', 'session'):
+        if filters.get(column):
+            query = query.filter(getattr(DailyStat, column) == filters[column])
+    query = _filter_dates(query, DailyStat.date, filters)
+
+    row = query.with_entities(
+        func.sum(DailyStat.trades).label('count'),
+        func.sum(DailyStat.tp).label('tp'),
+        func.sum(DailyStat.sl).label('sl'),
+        func.sum(DailyStat.be).label('be'),
+        func.sum(DailyStat.pnl_pct).label('rr_sum'),
+        (func.sum(DailyStat.tp_rr_sum) / func.nullif(func.sum(DailyStat.tp_rr_count), 0)).label('rr_avg'),
+    ).one()
+    return _stats_row(row)
+
+
+# Измерения, по которым можно разложить статистику журнала
+BREAKDOWN_DIMENSIONS = ('weekday', 'session', 'logic', 'bias', 'position', 'result_type', 'symbol')
+
+# Результат сделки в R - одно соответствие для дневных итогов, разбивки, аналитики и симуляции:
+# TP -> +rr, SL -> -1, BE и прочее -> 0
+OUTCOME_R = {'SL': -1.0, 'BE': 0.0}
+
+
+def r_multiple(result_type, rr) -> float:
+    """Результат одной сделки в R по OUTCOME_R; пустой rr у TP - 0"""
+    if result_type == 'TP':
+        return rr or 0
+    return OUTCOME_R.get(result_type, 0.0)
+
+
+R_MULTIPLE = case(
+    (Trade.result_type == 'TP', func.coalesce(Trade.rr, 0)),
+    *((Trade.result_type == result, value) for result, value in OUTCOME_R.items()),
+    else_=0
+)
+
+
+def grouped_stats(query, dimensions) -> list:
+    """
+    journal_stats для каждой комбинации значений колонок Trade одним GROUP BY запросом,
+    плюс сумма R. Строки отсортированы по значениям измерений
+    """
+    fields = [getattr(Trade, column) for column in dimensions]
+    rows = query.with_entities(*fields, *_aggregates(), func.sum(R_MULTIPLE).label('r_sum')) \
+        .order_by(None).group_by(*fields).order_by(*fields).all()
+    return [
+        {**dict(zip(dimensions, row[:len(dimensions)])), **_stats_row(row), 'r_sum': round(row.r_sum or 0, 2)}
+        for row in rows
+    ]
+
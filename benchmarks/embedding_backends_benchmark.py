@@ -0,0 +1,139 @@
+"""
+Сравнение бэкендов эмбеддингов: PyTorch SentenceTransformer, ONNX fp32 и ONNX int8.
+
+Каждый бэкенд запускается в отдельном процессе, чтобы RSS не смешивался.
+Выводит пропускную способность (текстов/с), RSS процесса после загрузки
+модели и после кодирования, а также косинусную близость векторов к PyTorch.
+
+Запуск из корня проекта:
+    python -m benchmarks.embedding_backends_benchmark --texts 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def synthetic_texts(n: int, seed: int = 42) -> list:
+    """Описания сделок в том же формате, что и для индекса AI"""
+    rng = np.random.default_rng(seed)
+    symbols = ["EURUSD", "GBPUSD", "USDJPY", "XAUUSD", "BTCUSD"]
+    notes = [
+        "вход по пробою уровня, держал до тейка",
+        "закрыл раньше из-за новостей по CPI",
+        "поздний вход, стоп за хаем",
+        "нет комментария",
+        "торговал против тренда, эмоции после убытка",
+        "entry on London open liquidity sweep",
+    ]
+    return [
+        f"СДЕЛКА: Дата=2025-{rng.integers(1, 13):02d}-{rng.integers(1, 29):02d}, "
+        f"Символ={rng.choice(symbols)}, Направление=None, R:R={rng.choice([1.0, 1.5, 2.0, 3.0])}, "
+        f"Профит=${round(float(rng.normal(50, 120)), 2)}, Результат={rng.choice(['TP', 'SL', 'BE'])}, "
+        f"Сессия={rng.choice(['ASIA', 'LONDON', 'NY'])}, Позиция={rng.choice(['Long', 'Short'])}, "
+        f"Комментарий={rng.choice(notes)}"
+        for _ in range(n)
+    ]
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса (Linux)"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+def load_encoder(backend: str):
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(MODEL_NAME)
+
+    from app.ai_modules.onnx_encoder import OnnxSentenceEncoder
+    return OnnxSentenceEncoder(MODEL_NAME, quantize=backend == "onnx-int8")
+
+
+def run_worker(backend: str, n_texts: int, batch_size: int, out_path: str):
+    """Замер одного бэкенда - выполняется в дочернем процессе"""
+    texts = synthetic_texts(n_texts)
+    rss_start = rss_mb()
+
+    started = time.perf_counter()
+    encoder = load_encoder(backend)
+    load_seconds = time.perf_counter() - started
+    rss_loaded = rss_mb()
+
+    # Прогрев: первый батч включает ленивую инициализацию
+    encoder.encode(texts[:batch_size], batch_size=batch_size)
+
+    started = time.perf_counter()
+    vectors = encoder.encode(texts, batch_size=batch_size)
+    encode_seconds = time.perf_counter() - started
+
+    np.save(out_path, np.asarray(vectors, dtype="float32"))
+    print(json.dumps({
+        "backend": backend,
+        "load_s": load_seconds,
+        "texts_per_s": n_texts / encode_seconds,
+        "rss_loaded_mb": rss_loaded - rss_start,
+        "rss_total_mb": rss_mb(),
+    }))
+
+
+def cosine_agreement(reference: np.ndarray, vectors: np.ndarray):
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    cosine = (reference * vectors).sum(axis=1)
+    return float(cosine.mean()), float(cosine.min())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput / RSS / agreement benchmark for embedding backends")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--worker", choices=list(BACKENDS), help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.texts, args.batch_size, args.out)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for backend in args.backends:
+            out_path = os.path.join(tmp_dir, f"{backend}.npy")
+            completed = subprocess.run(
+                [sys.executable, "-m", "benchmarks.embedding_backends_benchmark", "--worker", backend,
+                 "--texts", str(args.texts), "--batch-size", str(args.batch_size), "--out", out_path],
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                print(f"{backend}: ошибка\n{completed.stderr.strip()[-2000:]}")
+                continue
+            row = json.loads(completed.stdout.strip().splitlines()[-1])
+            row["vectors"] = np.load(out_path)
+            results[backend] = row
+
+    reference = results.get("torch", {}).get("vectors")
+    print(f"\n{'backend':>10} {'load s':>8} {'texts/s':>9} {'model MB':>9} {'RSS MB':>8} {'cos mean':>9} {'cos min':>8}")
+    for backend, row in results.items():
+        cos_mean, cos_min = cosine_agreement(reference, row["vectors"]) if reference is not None else (float("nan"),) * 2
+        print(f"{backend:>10} {row['load_s']:>8.2f} {row['texts_per_s']:>9.1f} {row['rss_loaded_mb']:>9.0f} "
+              f"{row['rss_total_mb']:>8.0f} {cos_mean:>9.4f} {cos_min:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Сравнение типов FAISS индекса на синтетических журналах.
+
+Для каждого размера журнала и типа индекса выводит время сборки,
+задержку одиночного запроса (p50/p99), размер индекса и recall@k
+относительно точного Flat поиска.
+
+Запуск из корня проекта:
+    python -m benchmarks.index_backends_benchmark --sizes 1000 10000 100000
+"""
+import argparse
+import time
+import numpy as np
+
+from app.ai_modules.index_backends import INDEX_SPECS, build_index, index_kind, index_size_bytes, search_params
+
+
+def synthetic_embeddings(n: int, dim: int, rng: np.random.Generator, clusters: int = 64) -> np.ndarray:
+    """
+    Нормированные векторы, сгруппированные вокруг центров - как эмбеддинги
+    похожих сделок (символ / сессия / результат) с разными комментариями
+    """
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def benchmark(index_type: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    ids = np.arange(len(vectors), dtype="int64")
+
+    started = time.perf_counter()
+    index = build_index(index_type, vectors.shape[1], vectors, ids)
+    build_seconds = time.perf_counter() - started
+
+    params = search_params(index)
+    latencies = []
+    found = np.empty((len(queries), k), dtype="int64")
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        _, labels = index.search(query[None, :], k, params=params)
+        latencies.append(time.perf_counter() - started)
+        found[i] = labels[0]
+
+    recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))])
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "type": index_type,
+        "kind": index_kind(index),
+        "build_s": build_seconds,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "size_mb": index_size_bytes(index) / 2 ** 20,
+        "recall": float(recall),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall / latency benchmark for AI index types")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--types", nargs="+", default=list(INDEX_SPECS), choices=list(INDEX_SPECS))
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    header = f"{'size':>8} {'type':>6} {'actual':>6} {'build s':>8} {'p50 ms':>8} {'p99 ms':>8} {'MB':>8} {'recall':>7}"
+
+    for size in args.sizes:
+        vectors = synthetic_embeddings(size, args.dim, rng)
+        # Запросы - слегка изменённые записи журнала
+        sample = rng.choice(size, args.queries, replace=size < args.queries)
+        queries = vectors[sample] + 0.1 * rng.standard_normal((args.queries, args.dim)).astype("float32")
+
+        # Эталон - точный поиск
+        exact = build_index("flat", args.dim, vectors, np.arange(size, dtype="int64"))
+        _, truth = exact.search(queries, args.k)
+
+        print(f"\n{header}")
+        for index_type in args.types:
+            row = benchmark(index_type, vectors, queries, truth, args.k)
+            print(f"{size:>8} {row['type']:>6} {row['kind']:>6} {row['build_s']:>8.2f} {row['p50_ms']:>8.3f} "
+                  f"{row['p99_ms']:>8.3f} {row['size_mb']:>8.1f} {row['recall']:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
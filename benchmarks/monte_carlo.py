@@ -0,0 +1,41 @@
+"""
+Время Монте-Карло симуляции (app/simulation.py) на синтетических исходах
+в зависимости от числа путей, размера блока и числа процессов.
+
+Запуск из корня проекта:
+    python -m benchmarks.monte_carlo --paths 100000 --trades 1000 --workers 1 4
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app import simulation
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation timing")
+    parser.add_argument("--paths", type=int, default=100_000)
+    parser.add_argument("--trades", type=int, default=1000)
+    parser.add_argument("--risk", type=float, default=0.01)
+    parser.add_argument("--chunk", type=int, nargs="+", default=[simulation.CHUNK_ELEMENTS])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    args = parser.parse_args()
+
+    # Журнал с винрейтом ~40%: TP 2-3R, SL, BE
+    rng = np.random.default_rng(42)
+    outcomes = np.concatenate([rng.uniform(2, 3, 40), -np.ones(45), np.zeros(15)])
+    print(f"Путей: {args.paths}, сделок в пути: {args.trades}, риск: {args.risk}\n")
+
+    for chunk in args.chunk:
+        simulation.CHUNK_ELEMENTS = chunk
+        for workers in args.workers:
+            started = time.perf_counter()
+            result = simulation.simulate(outcomes, args.paths, args.trades, args.risk, workers=workers)
+            elapsed = time.perf_counter() - started
+            print(f"блок {chunk:>10} чисел, процессов {workers}: {elapsed:6.2f} с  "
+                  f"(разорение {result['risk_of_ruin']}%, просадка p95 {result['max_drawdown']['p95']}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+EXPLAIN QUERY PLAN для основных запросов журнала до и после индексов Trade.
+
+База копируется в память: в копии "до" индексы из models.py удаляются,
+в копии "после" создаются, сам файл не меняется. Для каждого запроса
+печатается план и время выполнения; в конце - сколько запросов всё ещё
+читают таблицу trade целиком без индекса.
+
+Запуск из корня проекта:
+    python -m benchmarks.query_plans --db trades.db
+"""
+import argparse
+import sqlite3
+import time
+
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex
+
+from app.models import Trade
+
+# Запросы страницы журнала, фасетов, итогов, профиля и импорта из Notion
+QUERIES = {
+    "журнал: первая страница":
+        ("SELECT * FROM trade ORDER BY date DESC, id DESC LIMIT 51", ()),
+    "журнал: символ, следующая страница":
+        ("SELECT * FROM trade WHERE symbol = ? AND (date, id) < (?, ?) "
+         "ORDER BY date DESC, id DESC LIMIT 51", ("EURUSD", "2025-03-01", 1000000)),
+    "журнал: результат и период":
+        ("SELECT * FROM trade WHERE result_type = ? AND date >= ? AND date <= ? "
+         "ORDER BY date DESC, id DESC LIMIT 51", ("TP", "2025-01-01", "2025-03-31")),
+    "журнал: итоги по сессии":
+        ("SELECT count(id), sum(CASE WHEN result_type = 'TP' THEN risk * rr * 100 "
+         "WHEN result_type = 'SL' THEN -risk * 100 ELSE 0 END) FROM trade WHERE session = ?", ("LONDON",)),
+    "фасеты: DISTINCT symbol":
+        ("SELECT DISTINCT symbol FROM trade WHERE symbol IS NOT NULL AND symbol != '' ORDER BY symbol", ()),
+    "профиль: сделки по дате":
+        ("SELECT * FROM trade ORDER BY date", ()),
+    "импорт: ключи (date, symbol)":
+        ("SELECT date, symbol FROM trade", ()),
+}
+
+
+def index_ddl() -> list:
+    return [str(CreateIndex(index).compile(dialect=sqlite.dialect())) for index in Trade.__table__.indexes]
+
+
+def copy_to_memory(path: str) -> sqlite3.Connection:
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn = sqlite3.connect(":memory:")
+    source.backup(conn)
+    source.close()
+    return conn
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: tuple):
+    plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    started = time.perf_counter()
+    conn.execute(sql, params).fetchall()
+    return plan, (time.perf_counter() - started) * 1000
+
+
+def full_scan(plan: list) -> bool:
+    return any(step.startswith("SCAN trade") and "INDEX" not in step for step in plan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN before/after Trade indexes")
+    parser.add_argument("--db", default="trades.db", help="путь к SQLite базе журнала")
+    args = parser.parse_args()
+
+    before = copy_to_memory(args.db)
+    for (name,) in before.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'trade' "
+                                  "AND sql IS NOT NULL").fetchall():
+        before.execute(f'DROP INDEX "{name}"')
+
+    after = copy_to_memory(args.db)
+    for ddl in index_ddl():
+        after.execute(ddl.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1))
+    after.execute("ANALYZE trade")
+
+    count = after.execute("SELECT count(*) FROM trade").fetchone()[0]
+    print(f"Сделок в базе: {count}\n")
+
+    unindexed = 0
+    for name, (sql, params) in QUERIES.items():
+        plan_before, ms_before = explain(before, sql, params)
+        plan_after, ms_after = explain(after, sql, params)
+        unindexed += full_scan(plan_after)
+
+        print(f"== {name}")
+        print(f"   до    ({ms_before:7.2f} мс): {' / '.join(plan_before)}")
+        print(f"   после ({ms_after:7.2f} мс): {' / '.join(plan_after)}")
+
+    if unindexed:
+        print(f"\n⚠️ Запросов с полным проходом по trade после индексов: {unindexed}")
+
+
+if __name__ == "__main__":
+    main()
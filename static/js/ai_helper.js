@@ -35,6 +35,15 @@ document.addEventListener("DOMContentLoaded", () => {
     chatContainer.appendChild(messageDiv);
     chatContainer.scrollTop = chatContainer.scrollHeight;
     saveChatHistory();
+    return messageDiv;
+  }
+
+  function escapeHtml(text) {
+    return text
+      .replace(/&/g, "&amp;")
+      .replace(/</g, "&lt;")
+      .replace(/>/g, "&gt;")
+      .replace(/\n/g, "<br>");
   }
 
   // Функция для показа статуса ключа
@@ -95,9 +104,16 @@ document.addEventListener("DOMContentLoaded", () => {
     }, 500);
   }
 
+  function setLoadingLabel(text) {
+    const labelEl = loading && loading.querySelector("em");
+    if (labelEl) labelEl.firstChild.textContent = text;
+  }
+
   function hideLoading() {
     if (!loading || !submitBtn) return;
 
+    setLoadingLabel("Обрабатывается");
+
     loading.style.display = "none";
     submitBtn.disabled = false;
     if (loadingInterval) {
@@ -202,6 +218,130 @@ document.addEventListener("DOMContentLoaded", () => {
     console.log("Chat initialized successfully");
   }
 
+  const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+  // Отправка запроса к AI; пока система прогревается (503 warming_up) - повторяем
+  async function askAI(text, apiKey, url = "/ai/ask", attempts = 40) {
+    for (let attempt = 0; attempt < attempts; attempt++) {
+      const response = await fetch(url, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          "X-Requested-With": "XMLHttpRequest"
+        },
+        body: JSON.stringify({
+          text: text,
+          api_key: apiKey  // ⬅️ Ключ передается здесь
+        })
+      });
+
+      console.log("Response status:", response.status);
+
+      if (response.status === 503) {
+        const data = await response.json().catch(() => ({}));
+        if (data.status === "warming_up") {
+          setLoadingLabel(data.message || "AI система загружается");
+          await sleep(3000);
+          continue;
+        }
+      }
+
+      return response;
+    }
+    throw new Error("AI система слишком долго загружается, попробуйте позже");
+  }
+
+  // Ответ ассистента, который дорисовывается по событиям задачи:
+  // текст появляется по мере генерации, готовые абзацы заменяются HTML, отрендеренным на сервере
+  function createAnswerView() {
+    let messageDiv = null;
+    let bubble = null;
+    let fullText = "";
+    let renderedHtml = "";
+    let renderedUpto = 0;
+
+    const redraw = () => {
+      bubble.innerHTML = renderedHtml + escapeHtml(fullText.slice(renderedUpto));
+      chatContainer.scrollTop = chatContainer.scrollHeight;
+    };
+
+    return {
+      handle(eventName, data) {
+        if (eventName === "status") {
+          setLoadingLabel(data.status === "queued" && data.position
+            ? `В очереди (${data.position})`
+            : "Обрабатывается");
+          return;
+        }
+
+        if (!messageDiv) {
+          // Время до первого токена - ответ уже виден, спиннер больше не нужен
+          hideLoading();
+          messageDiv = addMessage("assistant", "", true);
+          bubble = messageDiv.querySelector(".chat-bubble");
+        }
+
+        if (eventName === "delta") {
+          fullText += data.text;
+        } else if (eventName === "html") {
+          renderedHtml = data.html;
+          renderedUpto = data.rendered;
+        } else if (eventName === "done") {
+          renderedHtml = data.html;
+          renderedUpto = fullText.length;
+        }
+        redraw();
+      },
+      discard() {
+        if (messageDiv) messageDiv.remove();
+      }
+    };
+  }
+
+  // Подписка на события задачи через EventSource.
+  // false - соединение оборвалось до конца задачи, результат нужно дождаться опросом
+  function streamJob(job, view) {
+    return new Promise((resolve, reject) => {
+      const source = new EventSource(job.stream_url);
+      ["status", "delta", "html"].forEach(name => {
+        source.addEventListener(name, event => view.handle(name, JSON.parse(event.data)));
+      });
+      source.addEventListener("done", event => {
+        source.close();
+        view.handle("done", JSON.parse(event.data));
+        resolve(true);
+      });
+      source.addEventListener("error", event => {
+        source.close();
+        // Событие error от сервера несёт данные, обрыв соединения - нет
+        if (event.data) reject(new Error(JSON.parse(event.data).error));
+        else resolve(false);
+      });
+    });
+  }
+
+  // Опрос статуса задачи, если EventSource недоступен или соединение оборвалось
+  async function pollJob(job, view) {
+    while (true) {
+      const response = await fetch(job.status_url, {
+        headers: { "X-Requested-With": "XMLHttpRequest" }
+      });
+      const data = await response.json();
+
+      if (!response.ok || data.status === "error") {
+        throw new Error(data.error || `HTTP error! status: ${response.status}`);
+      }
+      if (data.status === "done") {
+        view.handle("delta", { text: data.text });
+        view.handle("done", { html: data.response });
+        return;
+      }
+
+      view.handle("status", data);
+      await sleep(1000);
+    }
+  }
+
   // Обработка отправки формы
   async function handleFormSubmit(e) {
     e.preventDefault();
@@ -234,33 +374,28 @@ document.addEventListener("DOMContentLoaded", () => {
     showLoading();
 
     try {
-      // 2. Отправляем ключ вместе с запросом
-      const response = await fetch("/ai/ask", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          "X-Requested-With": "XMLHttpRequest"
-        },
-        body: JSON.stringify({
-          text: text,
-          api_key: apiKey  // ⬅️ Ключ передается здесь
-        })
-      });
-
-      console.log("Response status:", response.status);
+      // 2. Отправляем ключ вместе с запросом - сервер ставит его в очередь и возвращает задачу
+      const response = await askAI(text, apiKey);
+      const job = await response.json();
+      console.log("AI job:", job);
 
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
+      if (!response.ok || job.error) {
+        throw new Error(job.error || `HTTP error! status: ${response.status}`);
       }
 
-      const data = await response.json();
-      console.log("Response data:", data);
-
-      if (data.error) {
-        throw new Error(data.error);
+      // 3. Ответ приходит по мере генерации; без EventSource - опросом статуса
+      const view = createAnswerView();
+      try {
+        const streamed = window.EventSource ? await streamJob(job, view) : false;
+        if (!streamed) {
+          view.discard();
+          await pollJob(job, createAnswerView());
+        }
+      } catch (error) {
+        view.discard();
+        throw error;
       }
-
-      addMessage("assistant", data.response, true);
+      saveChatHistory();
 
     } catch (error) {
       console.error("Chat error:", error);
@@ -1,4 +1,5 @@
-// Массив для хранения выбранных сделок
+// Выбранные сделки: id хранятся отдельно от DOM, потому что строки таблицы перерисовываются
+const selectedIds = new Set();
 let selectedTrades = [];
 
 // Используем переменные из window.flaskData или значения по умолчанию
@@ -6,10 +7,219 @@ const currentDate = window.flaskData?.currentDate || new Date().toISOString().sp
 const dateFromFilter = window.flaskData?.dateFrom || '';
 const dateToFilter = window.flaskData?.dateTo || '';
 const DELETE_MULTIPLE_URL = window.flaskData?.deleteMultipleUrl || '/trades/delete_multiple';
+const TRADES_API_URL = window.flaskData?.tradesApiUrl || '/api/trades';
+
+// Сделок за один запрос к API и запас строк над и под видимой областью таблицы
+const JOURNAL_PAGE_SIZE = 200;
+const JOURNAL_BUFFER_ROWS = 10;
+// Сколько ответов API держать для If-None-Match
+const JOURNAL_CACHE_SIZE = 50;
+
+let journalTable = null;
 
 function submitForm() {
     const form = document.getElementById('filter-form');
-    if (form) form.submit();
+    if (!form) return;
+    if (!journalTable) {
+        form.submit();
+        return;
+    }
+
+    // Без перезагрузки страницы: фильтры в адресную строку, сделки - из API
+    const params = filterParams(form);
+    history.replaceState(null, '', params.toString() ? `?${params}` : window.location.pathname);
+    form.querySelectorAll('select').forEach(el => el.classList.toggle('active-filter', !!el.value));
+    selectedIds.clear();
+    journalTable.reload(params);
+}
+
+function filterParams(form) {
+    const params = new URLSearchParams();
+    new FormData(form).forEach((value, key) => {
+        if (value) params.append(key, value);
+    });
+    return params;
+}
+
+function escapeHtml(value) {
+    return String(value ?? '').replace(/[&<>"']/g, ch => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    }[ch]));
+}
+
+// Виртуальная таблица журнала: сделки подгружаются страницами по курсору,
+// в DOM только видимые строки, остальное место занимают распорки сверху и снизу
+class JournalTable {
+    constructor(scroll, body) {
+        this.scroll = scroll;
+        this.body = body;
+        this.columns = body.closest('table').querySelectorAll('thead th').length;
+        this.params = new URLSearchParams();
+        this.rows = [];
+        this.nextCursor = null;
+        this.done = false;
+        this.loading = false;
+        this.generation = 0;
+        this.rowHeight = 0;
+        this.renderQueued = false;
+        this.responses = new Map();  // url -> {etag, data}
+
+        this.scroll.addEventListener('scroll', () => this.scheduleRender());
+        window.addEventListener('resize', () => this.scheduleRender());
+    }
+
+    reload(params) {
+        this.params = params;
+        this.rows = [];
+        this.nextCursor = null;
+        this.done = false;
+        this.loading = false;
+        this.generation += 1;
+        this.scroll.scrollTop = 0;
+        return this.loadMore();
+    }
+
+    async fetchPage(url) {
+        // Пока журнал не менялся, сервер отвечает 304 и используется сохранённый ответ
+        const cached = this.responses.get(url);
+        const response = await fetch(url, {
+            headers: cached ? { 'If-None-Match': cached.etag } : {},
+            cache: 'no-store'
+        });
+        if (response.status === 304 && cached) return cached.data;
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        if (etag) {
+            this.responses.delete(url);
+            this.responses.set(url, { etag, data });
+            if (this.responses.size > JOURNAL_CACHE_SIZE) {
+                this.responses.delete(this.responses.keys().next().value);
+            }
+        }
+        return data;
+    }
+
+    async loadMore() {
+        if (this.loading || this.done) return;
+        this.loading = true;
+
+        const generation = this.generation;
+        const params = new URLSearchParams(this.params);
+        params.set('per_page', JOURNAL_PAGE_SIZE);
+        if (this.nextCursor) params.set('after', this.nextCursor);
+
+        try {
+            const data = await this.fetchPage(`${TRADES_API_URL}?${params}`);
+            if (generation !== this.generation) return;  // фильтры успели смениться
+
+            this.rows.push(...data.items);
+            this.nextCursor = data.next_cursor;
+            this.done = !data.next_cursor;
+            if (data.totals) updateTotals(data.totals);
+            this.loading = false;
+            this.render();
+        } catch (error) {
+            console.error('Error:', error);
+            if (generation === this.generation) showMessage('Ошибка загрузки сделок', 'error');
+        } finally {
+            if (generation === this.generation) this.loading = false;
+        }
+    }
+
+    scheduleRender() {
+        if (this.renderQueued) return;
+        this.renderQueued = true;
+        requestAnimationFrame(() => {
+            this.renderQueued = false;
+            this.render();
+        });
+    }
+
+    render() {
+        const total = this.rows.length;
+        const height = this.rowHeight || 48;
+        const top = this.scroll.scrollTop;
+        const viewport = this.scroll.clientHeight || window.innerHeight;
+        const first = Math.max(0, Math.floor(top / height) - JOURNAL_BUFFER_ROWS);
+        const last = Math.min(total, Math.ceil((top + viewport) / height) + JOURNAL_BUFFER_ROWS);
+
+        const html = [];
+        if (first > 0) html.push(this.spacerHtml(first * height));
+        for (let i = first; i < last; i++) html.push(this.rowHtml(this.rows[i], i));
+        if (last < total) html.push(this.spacerHtml((total - last) * height));
+        this.body.innerHTML = html.join('');
+
+        document.getElementById('journalContent')?.toggleAttribute('hidden', total === 0 && this.done);
+        document.getElementById('journalEmpty')?.toggleAttribute('hidden', !(total === 0 && this.done));
+
+        // Высота строки берётся с первой отрисовки (строки со скриншотом выше),
+        // дальше все строки рисуются с ней, чтобы распорки совпадали с прокруткой
+        if (!this.rowHeight && last > first) {
+            const rendered = [...this.body.querySelectorAll('tr.clickable-row')];
+            this.rowHeight = Math.max(...rendered.map(row => row.offsetHeight));
+            if (this.rowHeight > 0) {
+                this.render();
+                return;
+            }
+        }
+
+        updateSelectedTrades();
+
+        // Следующая страница запрашивается заранее, пока до конца загруженного меньше запаса
+        if (!this.done && last >= total - JOURNAL_BUFFER_ROWS) this.loadMore();
+    }
+
+    spacerHtml(height) {
+        return `<tr class="journal-spacer" style="height:${height}px"><td colspan="${this.columns}"></td></tr>`;
+    }
+
+    rowHtml(trade, index) {
+        const style = this.rowHeight ? ` style="height:${this.rowHeight}px"` : '';
+        const date = trade.date ? `${trade.date.slice(8, 10)}.${trade.date.slice(5, 7)}` : '';
+        const risk = trade.risk !== null ? `${(trade.risk * 100).toFixed(1)}` : '-';
+
+        let pnl = '-';
+        if (trade.rr !== null && trade.risk !== null) {
+            const cls = trade.rr > 0 ? 'text-success' : 'text-danger';
+            pnl = `<span class="${cls}">${(trade.rr * trade.risk * 100).toFixed(2)}%</span>`;
+        }
+
+        const badges = { TP: 'bg-success', SL: 'bg-danger', BE: 'bg-secondary' };
+        const result = badges[trade.result_type]
+            ? `<span class="badge ${badges[trade.result_type]}">${trade.result_type}</span>`
+            : '<span class="badge bg-light text-dark">?</span>';
+
+        const screenshot = trade.screenshot_url
+            ? `<a href="${escapeHtml(trade.screenshot_url)}" target="_blank" rel="noopener noreferrer">
+                 <img src="${escapeHtml(trade.screenshot_url)}" alt="Screenshot" class="screenshot-thumb" loading="lazy" />
+               </a>`
+            : '-';
+
+        return `<tr class="clickable-row" data-url="${escapeHtml(trade.url)}"${style}>
+            <td><input type="checkbox" class="form-check-input trade-checkbox" value="${trade.id}"${selectedIds.has(trade.id) ? ' checked' : ''}></td>
+            <td>${index + 1}</td>
+            <td>${date}</td>
+            <td>${escapeHtml(trade.symbol)}</td>
+            <td>${escapeHtml((trade.session || '').slice(0, 2))}</td>
+            <td>${escapeHtml(trade.position)}</td>
+            <td>${escapeHtml(trade.bias)}</td>
+            <td>${risk}%</td>
+            <td>${trade.rr !== null ? trade.rr : '-'}</td>
+            <td>${pnl}</td>
+            <td>${result}</td>
+            <td>${screenshot}</td>
+        </tr>`;
+    }
+}
+
+function updateTotals(totals) {
+    const values = { totalCount: totals.count, rrAvg: totals.rr_avg.toFixed(2), rrSum: totals.rr_sum.toFixed(2) };
+    Object.entries(values).forEach(([id, value]) => {
+        const el = document.getElementById(id);
+        if (el) el.textContent = value;
+    });
 }
 
 // Инициализация flatpickr с правильными значениями
@@ -59,12 +269,32 @@ document.querySelectorAll('#filter-form select').forEach(el => {
 
 // Функции для массового удаления
 document.addEventListener('DOMContentLoaded', function() {
-    // Обработчик для "Выбрать все"
+    const scroll = document.getElementById('journalScroll');
+    const body = document.getElementById('journalBody');
+    if (scroll && body) {
+        journalTable = new JournalTable(scroll, body);
+        // Вместо постраничных ссылок - подгрузка при прокрутке
+        document.getElementById('journalPagination')?.setAttribute('hidden', '');
+        journalTable.reload(filterParams(document.getElementById('filter-form')));
+
+        // Клики и чекбоксы обрабатываются делегированием: строки постоянно перерисовываются
+        body.addEventListener('click', event => {
+            const row = event.target.closest('tr.clickable-row');
+            if (!row || !row.dataset.url) return;
+            if (event.target.closest('td:first-child') || event.target.closest('a')) return;
+            window.location = row.dataset.url;
+        });
+    }
+
+    // Обработчик для "Выбрать все" - все загруженные сделки, а не только видимые строки
     const selectAll = document.getElementById('selectAll');
     if (selectAll) {
         selectAll.addEventListener('change', function() {
-            const checkboxes = document.querySelectorAll('.trade-checkbox');
-            checkboxes.forEach(checkbox => {
+            const ids = journalTable
+                ? journalTable.rows.map(trade => trade.id)
+                : [...document.querySelectorAll('.trade-checkbox')].map(checkbox => parseInt(checkbox.value));
+            ids.forEach(id => this.checked ? selectedIds.add(id) : selectedIds.delete(id));
+            document.querySelectorAll('.trade-checkbox').forEach(checkbox => {
                 checkbox.checked = this.checked;
             });
             updateSelectedTrades();
@@ -72,8 +302,11 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // Обработчики для чекбоксов сделок
-    document.querySelectorAll('.trade-checkbox').forEach(checkbox => {
-        checkbox.addEventListener('change', updateSelectedTrades);
+    document.addEventListener('change', event => {
+        if (!event.target.classList.contains('trade-checkbox')) return;
+        const id = parseInt(event.target.value);
+        event.target.checked ? selectedIds.add(id) : selectedIds.delete(id);
+        updateSelectedTrades();
     });
 
     // Обработчик для кнопки удаления
@@ -93,12 +326,7 @@ document.addEventListener('DOMContentLoaded', function() {
 });
 
 function updateSelectedTrades() {
-    selectedTrades = [];
-    const checkboxes = document.querySelectorAll('.trade-checkbox:checked');
-
-    checkboxes.forEach(checkbox => {
-        selectedTrades.push(parseInt(checkbox.value)); // Преобразуем в число
-    });
+    selectedTrades = [...selectedIds];
 
     const deleteBtn = document.getElementById('deleteSelected');
     const selectAll = document.getElementById('selectAll');
@@ -113,7 +341,9 @@ function updateSelectedTrades() {
     }
 
     if (selectAll) {
-        const totalCheckboxes = document.querySelectorAll('.trade-checkbox').length;
+        const totalCheckboxes = journalTable
+            ? journalTable.rows.length
+            : document.querySelectorAll('.trade-checkbox').length;
         selectAll.checked = selectedTrades.length === totalCheckboxes && totalCheckboxes > 0;
         selectAll.indeterminate = selectedTrades.length > 0 && selectedTrades.length < totalCheckboxes;
     }
@@ -155,10 +385,15 @@ async function deleteSelectedTrades() {
             // Показываем сообщение об успехе
             showMessage(`Успешно удалено ${result.deleted_count || selectedTrades.length} сделок`, 'success');
 
-            // Перезагружаем страницу через секунду
-            setTimeout(() => {
-                window.location.reload();
-            }, 1000);
+            // Версия журнала изменилась - таблица и итоги подгружаются заново
+            selectedIds.clear();
+            if (journalTable) {
+                journalTable.reload(journalTable.params);
+            } else {
+                setTimeout(() => {
+                    window.location.reload();
+                }, 1000);
+            }
         } else {
             throw new Error('Ошибка при удалении');
         }
@@ -145,7 +145,7 @@ function renderCharts() {
           backgroundColor: isDark ? 'rgba(77, 171, 247, 0.2)' : 'rgba(0, 123, 255, 0.1)',
           fill: true,
           tension: 0.3,
-          pointRadius: 3,
+          pointRadius: equityPointRadius(window.chartData.equityData.length),
           pointBackgroundColor: themeColor,
           pointBorderColor: isDark ? '#ffffff' : '#000000',
           pointBorderWidth: 1
@@ -185,10 +185,99 @@ function renderCharts() {
   }
 }
 
+// На плотной кривой точки только мешают
+function equityPointRadius(count) {
+  return count > 100 ? 0 : 3;
+}
+
+// Первоначальная (не приближенная) кривая, чтобы вернуться к ней по "Сброс"
+let equityOverview = null;
+
+async function fetchEquity(params) {
+  // Фильтры журнала берём из адреса страницы профиля
+  const query = new URLSearchParams(window.location.search);
+  query.delete('points');
+  Object.entries(params).forEach(([key, value]) => { if (value) query.set(key, value); });
+
+  const response = await fetch(`${window.chartData.equityUrl}?${query}`, { headers: { 'Accept': 'application/json' } });
+  if (!response.ok) {
+    throw new Error(`HTTP ${response.status}`);
+  }
+  return response.json();
+}
+
+function updateEquity(labels, values) {
+  window.chartData.equityLabels = labels;
+  window.chartData.equityData = values;
+  if (!equityChartInstance) return;
+
+  const dataset = equityChartInstance.data.datasets[0];
+  equityChartInstance.data.labels = labels;
+  dataset.data = values;
+  dataset.pointRadius = equityPointRadius(values.length);
+  equityChartInstance.update();
+}
+
+// Сервер прореживает кривую до числа точек по умолчанию; подгоняем его под реальную ширину графика
+async function fitEquityToViewport() {
+  const canvas = document.getElementById('equityChart');
+  const data = window.chartData;
+  if (!canvas || !data || !data.equityUrl) return;
+
+  // Около одной точки на 2 пикселя ширины
+  const target = Math.max(50, Math.round(canvas.clientWidth / 2));
+  const current = data.equityData.length;
+  const enough = current >= data.equityTotal && target >= current;
+  if (enough || Math.abs(target - current) < current * 0.2) return;
+
+  try {
+    const equity = await fetchEquity({ points: target });
+    updateEquity(equity.labels, equity.values);
+  } catch (error) {
+    console.error('Error loading equity curve:', error);
+  }
+}
+
+function initEquityZoom() {
+  const form = document.getElementById('equityZoomForm');
+  const reset = document.getElementById('equityZoomReset');
+  if (!form) return;
+
+  form.addEventListener('submit', async (event) => {
+    event.preventDefault();
+    const zoomFrom = form.elements.zoom_from.value;
+    const zoomTo = form.elements.zoom_to.value;
+    if (!zoomFrom && !zoomTo) return;
+
+    if (!equityOverview) {
+      equityOverview = { labels: window.chartData.equityLabels, values: window.chartData.equityData };
+    }
+    try {
+      // Срез по датам приходит в полном разрешении
+      const equity = await fetchEquity({ zoom_from: zoomFrom, zoom_to: zoomTo });
+      updateEquity(equity.labels, equity.values);
+    } catch (error) {
+      console.error('Error zooming equity curve:', error);
+    }
+  });
+
+  reset?.addEventListener('click', () => {
+    form.reset();
+    if (equityOverview) {
+      updateEquity(equityOverview.labels, equityOverview.values);
+      equityOverview = null;
+    }
+  });
+}
+
 // Ждем полной загрузки DOM и Chart.js
 document.addEventListener('DOMContentLoaded', function() {
+  initEquityZoom();
   // Небольшая задержка чтобы убедиться что Chart.js загружен
-  setTimeout(renderCharts, 100);
+  setTimeout(() => {
+    renderCharts();
+    fitEquityToViewport();
+  }, 100);
 });
 
 // Экспортируем функцию для повторного использования
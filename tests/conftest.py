@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Пакет app импортируется из корня проекта при любом способе запуска pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,83 @@
+"""
+Локальная заглушка OpenRouter chat/completions: потоковые запросы получают SSE-фрагменты
+в формате OpenRouter, обычные - тот же текст одним JSON.
+
+Для ручной проверки без сети:
+    python tests/openrouter_stub.py --port 8765
+    OPENROUTER_BASE_URL=http://127.0.0.1:8765 python run.py
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Фрагменты ответа: markdown с переносами строк, чтобы стрим отдавал и промежуточный html
+CHUNKS = ["Привет", "!\n\n", "**Итог**", " по сделкам", ":\n", "- пункт"]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.server.requests.append({"path": self.path, "headers": dict(self.headers), "body": body})
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            # OpenRouter присылает комментарии SSE, пока модель не начала отвечать
+            self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+            for chunk in self.server.chunks:
+                event = {"choices": [{"delta": {"content": chunk}}]}
+                self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+
+        payload = json.dumps({"choices": [{"message": {"content": "".join(self.server.chunks)}}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class OpenRouterStub:
+    """Заглушка в фоновом потоке; base_url подставляется в OPENROUTER_BASE_URL, requests - принятые запросы"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, chunks=CHUNKS):
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.chunks = list(chunks)
+        self.server.requests = []
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self) -> list:
+        return self.server.requests
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="openrouter-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenRouter chat/completions stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    stub = OpenRouterStub(args.host, args.port)
+    print(f"OPENROUTER_BASE_URL={stub.base_url}")
+    stub.server.serve_forever()
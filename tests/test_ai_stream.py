@@ -0,0 +1,121 @@
+"""
+/ai/ask/stream целиком: очередь задач, поиск сделок, промпт и потоковый ответ модели,
+где вместо OpenRouter - локальная заглушка (tests/openrouter_stub.py)
+"""
+import hashlib
+import json
+from datetime import date
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from openrouter_stub import CHUNKS, OpenRouterStub
+
+
+class HashingEncoder:
+    """Детерминированные эмбеддинги по словам текста - чтобы тест не скачивал модель sentence-transformers"""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True,
+               show_progress_bar: bool = False, normalize_embeddings: bool = True) -> np.ndarray:
+        single = isinstance(sentences, str)
+        vectors = np.zeros((1 if single else len(sentences), self.dim), dtype="float32")
+        for row, text in enumerate([sentences] if single else sentences):
+            for word in text.lower().split():
+                vectors[row, int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dim] += 1
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+
+def _parse_sse(body: str) -> list:
+    """Список (событие, данные) из тела SSE; комментарии keep-alive пропускаются"""
+    events = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if line and not line.startswith(":"))
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture
+def stub():
+    server = OpenRouterStub().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, stub):
+    # Кеши эмбеддингов, индексов и календаря пишутся относительно рабочей папки
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'trades.db'}")
+    monkeypatch.setenv("CALENDAR_DB", str(tmp_path / "calendar.db"))
+    monkeypatch.setenv("OPENROUTER_BASE_URL", stub.base_url)
+    monkeypatch.setenv("AI_WARMUP", "0")
+    monkeypatch.setenv("AI_EMBEDDING_BACKEND", "torch")
+
+    from app import create_app, db
+    from app.ai_modules import calendar_store, news_provider
+    from app.ai_modules.ai_client import AI_Client
+    from app.models import Trade
+    from app.routes import ai as ai_routes
+
+    monkeypatch.setattr(AI_Client, "embedding_model", property(lambda self: HashingEncoder()))
+    # Провайдер новостей без фонового обновления из сети
+    monkeypatch.setattr(calendar_store, "_store", None)
+    monkeypatch.setattr(news_provider, "_provider", news_provider.ForexNewsProvider(cache_dir=str(tmp_path)))
+    # Состояние AI на процесс - у каждого теста своё
+    monkeypatch.setattr(ai_routes, "trade_ai", None)
+    monkeypatch.setattr(ai_routes, "job_queue", None)
+
+    app = create_app()
+    with app.app_context():
+        db.session.add_all([
+            Trade(date=date(2025, 3, 3), symbol="EURUSD", session="LONDON", position="Long",
+                  direction="Buy", risk=0.01, rr=2.5, result_type="TP", notes="Пробой уровня"),
+            Trade(date=date(2025, 3, 4), symbol="GBPUSD", session="NY", position="Short",
+                  direction="Sell", risk=0.01, rr=2.0, result_type="SL", notes="Вход против тренда"),
+        ])
+        db.session.commit()
+        # Клиент строится заранее, иначе первый запрос получит 503 на время прогрева
+        ai_routes.get_trade_ai()
+    return app
+
+
+def test_ask_stream_relays_model_chunks(app, stub):
+    response = app.test_client().post(
+        "/ai/ask/stream", json={"text": "Разбери мои последние сделки", "api_key": "test-key"}
+    )
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = _parse_sse(response.get_data(as_text=True))
+    names = [name for name, _ in events]
+
+    assert names[-1] == "done"
+    assert "error" not in names
+    assert "".join(data["text"] for name, data in events if name == "delta") == "".join(CHUNKS)
+    # Промежуточный markdown отдаётся на границах строк, до финального ответа
+    assert names.index("html") < names.index("done")
+    done = events[-1][1]
+    assert "<strong>Итог</strong>" in done["html"]
+    assert done["usage"]["completion_tokens"] > 0
+
+    # В модель ушёл потоковый запрос с ключом пользователя и сделками журнала в промпте
+    assert len(stub.requests) == 1
+    request = stub.requests[0]
+    assert request["path"] == "/chat/completions"
+    assert request["headers"]["Authorization"] == "Bearer test-key"
+    assert request["body"]["stream"] is True
+    assert "EURUSD" in request["body"]["messages"][0]["content"]
+
+
+def test_ask_stream_requires_api_key(app, stub):
+    response = app.test_client().post("/ai/ask/stream", json={"text": "Разбери мои сделки"})
+
+    assert response.status_code == 400
+    assert stub.requests == []